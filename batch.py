@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from cache import ResponseCache
+from cassette import Cassette
+from checkpoint import Checkpoint
+from constants import MODEL_NAME, RATE_LIMITS, CANDIDATES, CANDIDATE_SELECTION, BATCH_WORKERS, CONVERGENCE_MIN_GAIN, \
+    EXECUTOR, MUTATION_TESTING, LOCAL_DECISION, SCORE_PREDICTOR, CONTEXT_MODE
+from convergence import ConvergenceDetector
+from executors import create_executor
+from mutation import MutationTester
+from rate_limiter import RateLimiter
+from score_predictor import ScorePredictor
+from supervisor import ExecutionLimits
+from test_suite_generation import LOGGER, PROJECT_CONTEXT, TestGenChat, TestEvalChat, Pipeline, \
+    add_cassette_arguments, add_context_arguments, add_executor_arguments, add_limit_arguments, cassette_from_arguments, limits_from_arguments
+
+
+@dataclass
+class ProjectResult:
+    project: str
+    status: str = "pending"  # pending -> running -> done / failed
+    iterations: int = 0
+    scores: list[int] = field(default_factory=list)
+    duration: float = 0.0
+    error: str | None = None
+
+
+class BatchRunner:
+    def __init__(self, project_dirs: list[str], workers: int = BATCH_WORKERS, candidates: int = CANDIDATES,
+                 selection: str = CANDIDATE_SELECTION, limiter: RateLimiter | None = None,
+                 cache: ResponseCache | None = None, cassette: Cassette | None = None, resume: bool = False,
+                 min_gain: float = CONVERGENCE_MIN_GAIN, executor: str = EXECUTOR, test_cache: bool = True,
+                 limits: ExecutionLimits | None = None, mutation: bool = MUTATION_TESTING,
+                 local_decision: bool = LOCAL_DECISION, predictor: ScorePredictor | None = None,
+                 context_mode: str = CONTEXT_MODE):
+        self.project_dirs = project_dirs
+        self.workers = workers
+        self.candidates = candidates
+        self.selection = selection
+        self.limiter = limiter
+        self.cache = cache
+        self.cassette = cassette
+        self.resume = resume
+        self.min_gain = min_gain
+        self.executor = executor
+        self.test_cache = test_cache
+        self.limits = limits
+        self.mutation = mutation
+        self.local_decision = local_decision
+        self.predictor = predictor  # shared by all projects, every evaluator score trains it
+        self.context_mode = context_mode
+        self.results = {project_dir: ProjectResult(project_dir) for project_dir in project_dirs}
+
+        os.makedirs("logs/batch", exist_ok=True)
+        self.report_path = f"logs/batch/batch_{datetime.now().strftime('%Y-%m-%d_%H_%M_%S')}.json"
+
+    def _write_report(self):
+        with open(self.report_path, "w") as report:
+            json.dump([asdict(result) for result in self.results.values()], report, indent=2)
+
+    def _progress(self, project_dir: str, iteration: int, stats: TestEvalChat.EvalResponse):
+        result = self.results[project_dir]
+        result.iterations = iteration
+        result.scores.append(stats["score"])
+        self._write_report()
+
+    async def _run_project(self, project_dir: str, pool: asyncio.Semaphore):
+        async with pool:
+            PROJECT_CONTEXT.set(os.path.basename(os.path.normpath(project_dir)))
+            result = self.results[project_dir]
+            result.status = "running"
+            self._write_report()
+
+            start = time.monotonic()
+            executor = create_executor(self.executor, project_dir, self.test_cache, self.limits)
+            mutation = MutationTester(project_dir, limits=self.limits) if self.mutation else None
+            try:
+                api_key = os.getenv("GEMINI_API_KEY")
+                gen_chat = TestGenChat(api_key, MODEL_NAME, self.limiter, project_dir, self.cache,
+                                       self.cassette, self.context_mode)
+                eval_chat = TestEvalChat(api_key, MODEL_NAME, self.limiter, project_dir, self.cache,
+                                         self.cassette, self.context_mode)
+                pipeline = Pipeline(gen_chat, eval_chat, self.candidates, self.selection,
+                                    Checkpoint.for_project(project_dir),
+                                    lambda iteration, stats: self._progress(project_dir, iteration, stats),
+                                    ConvergenceDetector(self.min_gain) if self.min_gain > 0 else None, executor,
+                                    mutation, self.local_decision, self.predictor)
+                await pipeline.run(self.resume)
+                result.status = "done"
+            except Exception as e:
+                LOGGER.exception(f"Test suite generation failed for {project_dir}!")
+                result.status, result.error = "failed", f"{type(e).__name__}: {e}"
+            finally:
+                executor.close()
+                if mutation:
+                    mutation.close()
+            result.duration = time.monotonic() - start
+            self._write_report()
+
+            finished = sum(r.status in ("done", "failed") for r in self.results.values())
+            LOGGER.info(f"Project finished with status {result.status} "
+                        f"({finished}/{len(self.results)} projects finished)")
+
+    async def run(self) -> list[ProjectResult]:
+        LOGGER.info(f"Starting batch of {len(self.project_dirs)} projects with {self.workers} workers "
+                    f"(report: {self.report_path})")
+        pool = asyncio.Semaphore(self.workers)
+        await asyncio.gather(*(self._run_project(project_dir, pool) for project_dir in self.project_dirs))
+
+        for result in self.results.values():
+            score = result.scores[-1] if result.scores else "-"
+            LOGGER.info(f"{result.project}: {result.status}, score {score} after {result.iterations} iterations "
+                        f"({result.duration:.0f}s)")
+        if self.cache:
+            self.cache.log_stats()
+        return list(self.results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate test suites for many projects concurrently")
+    parser.add_argument("projects", nargs="*", help="project roots (containing src/)")
+    parser.add_argument("-f", "--projects-file", help="file listing one project root per line")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="projects processed concurrently")
+    parser.add_argument("--candidates", type=int, default=CANDIDATES,
+                        help="number of candidate test suites generated concurrently per iteration")
+    parser.add_argument("--selection", choices=["local", "evaluator"], default=CANDIDATE_SELECTION,
+                        help="pick the best candidate by local execution results or by evaluator score")
+    parser.add_argument("--no-cache", action="store_true", help="always query the API, bypassing the response cache")
+    parser.add_argument("--resume", action="store_true", help="continue every project from its checkpoint")
+    parser.add_argument("--min-gain", type=float, default=CONVERGENCE_MIN_GAIN,
+                        help="stop once the expected score gain per API call drops below this (0 disables)")
+    add_executor_arguments(parser)
+    parser.add_argument("--no-mutation", action="store_true",
+                        help="do not run the mutants of src/ against every executed test suite")
+    parser.add_argument("--no-local-decision", action="store_true",
+                        help="let the evaluator score every test suite, even if the local results are clear")
+    parser.add_argument("--no-predictor", action="store_true",
+                        help="do not replace confident evaluator scores by the score predicted from local results")
+    add_context_arguments(parser)
+    add_limit_arguments(parser)
+    add_cassette_arguments(parser)
+    args = parser.parse_args()
+
+    project_dirs = list(args.projects)
+    if args.projects_file:
+        with open(args.projects_file, "r") as f:
+            project_dirs += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not project_dirs:
+        parser.error("no project roots given")
+
+    cassette = cassette_from_arguments(args)
+    limiter = None if args.no_rate_limit else RateLimiter(RATE_LIMITS)
+    cache = None if args.no_cache or cassette else ResponseCache()
+    asyncio.run(BatchRunner(project_dirs, args.workers, args.candidates, args.selection, limiter, cache,
+                            cassette, args.resume, args.min_gain, args.executor,
+                            not args.no_test_cache, limits_from_arguments(args),
+                            MUTATION_TESTING and not args.no_mutation,
+                            LOCAL_DECISION and not args.no_local_decision,
+                            ScorePredictor() if SCORE_PREDICTOR and not args.no_predictor else None,
+                            args.context).run())
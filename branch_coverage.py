@@ -0,0 +1,133 @@
+import ast
+import inspect
+import types
+from dataclasses import asdict, dataclass, field
+
+from utils import parse_source
+
+# how a branch of the given kind was never taken: (to its body, past its body)
+OUTCOMES = {"if": ("was never true", "was never false"), "while": ("was never true", "was never false"),
+            "for": ("never iterated", "never ran to completion")}
+
+
+@dataclass
+class Branch:
+    line: int
+    kind: str  # if, while or for
+    body: int  # first line of the body
+    exits: bool = True  # False for loops that can only be left by break, return or an exception
+
+    def missing(self, destinations: set[int]) -> list[str]:
+        missing = []
+        if self.body not in destinations:
+            missing.append(OUTCOMES[self.kind][0])
+        if self.exits and not destinations - {self.body}:
+            missing.append(OUTCOMES[self.kind][1])
+        return missing
+
+
+@dataclass
+class FileCoverage:
+    lines: int
+    covered_lines: int
+    branches: int  # two per branch statement that can be left both ways, one otherwise
+    covered_branches: int
+    missing_lines: list[int] = field(default_factory=list)
+    missing_branches: list[str] = field(default_factory=list)  # e.g. 72 `if line[i + 1] == "=":` was never false
+
+
+def _ranges(lines: list[int]) -> str:
+    ranges = []
+    for line in lines:
+        if ranges and ranges[-1][1] == line - 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    return ", ".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+@dataclass
+class CoverageReport:
+    files: dict[str, FileCoverage] = field(default_factory=dict)
+
+    def totals(self) -> dict[str, int]:
+        return {name: sum(getattr(coverage, name) for coverage in self.files.values())
+                for name in ("lines", "covered_lines", "branches", "covered_branches")}
+
+    def summary(self) -> str:
+        totals = self.totals()
+        line_rate = 100 * totals["covered_lines"] / totals["lines"] if totals["lines"] else 100.0
+        branch_rate = 100 * totals["covered_branches"] / totals["branches"] if totals["branches"] else 100.0
+        return (f"line coverage {line_rate:.1f}% ({totals['covered_lines']}/{totals['lines']}), "
+                f"branch coverage {branch_rate:.1f}% ({totals['covered_branches']}/{totals['branches']})")
+
+    def missing_lines(self) -> dict[str, str]:
+        return {path: _ranges(coverage.missing_lines) for path, coverage in self.files.items()
+                if coverage.missing_lines}
+
+    def missing_branches(self) -> list[str]:
+        return [f"{path}:{branch}" for path, coverage in self.files.items() for branch in coverage.missing_branches]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls({path: FileCoverage(**coverage) for path, coverage in data["files"].items()})
+
+
+def _function_codes(code: types.CodeType):
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            if const.co_flags & inspect.CO_OPTIMIZED:
+                yield const
+            yield from _function_codes(const)
+
+
+def executable_lines(source: str, path: str) -> set[int]:
+    # lines of function bodies, everything else runs while src is imported and is not measured
+    return {line for code in _function_codes(compile(source, path, "exec")) for _, _, line in code.co_lines()
+            if line is not None and line != code.co_firstlineno}
+
+
+def branches(tree: ast.AST) -> list[Branch]:
+    found = []
+    for function in ast.walk(tree):
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for node in ast.walk(function):
+            if isinstance(node, (ast.If, ast.While, ast.For, ast.AsyncFor)) and node.body[0].lineno != node.lineno:
+                exits = not (isinstance(node, ast.While) and isinstance(node.test, ast.Constant) and node.test.value)
+                kind = {ast.If: "if", ast.While: "while"}.get(type(node), "for")
+                found.append(Branch(node.lineno, kind, node.body[0].lineno, exits))
+    # branches of nested functions are found once per enclosing function
+    return sorted({branch.line: branch for branch in found}.values(), key=lambda branch: branch.line)
+
+
+def measure_coverage(sources: dict[str, str], lines: dict[str, set[int]],
+                     arcs: dict[str, set[tuple[int, int]]]) -> CoverageReport:
+    # sources by their path relative to the project (src/lexer.py), like the executed lines and arcs
+    report = CoverageReport()
+    for path, source in sources.items():
+        try:
+            tree = parse_source(source)
+            executable = executable_lines(source, path)
+        except (SyntaxError, ValueError):
+            continue
+        source_lines = source.splitlines()
+        covered = lines.get(path, set()) & executable
+        destinations: dict[int, set[int]] = {}
+        for start, end in arcs.get(path, ()):
+            destinations.setdefault(start, set()).add(end)
+
+        total_branches, missing_branches = 0, []
+        for branch in branches(tree):
+            total_branches += 2 if branch.exits else 1
+            for outcome in branch.missing(destinations.get(branch.line, set())):
+                missing_branches.append(f"{branch.line} `{source_lines[branch.line - 1].strip()}` {outcome}")
+        if not executable and not total_branches:
+            continue
+        covered_branches = total_branches - len(missing_branches)
+        report.files[path] = FileCoverage(len(executable), len(covered), total_branches, covered_branches,
+                                          sorted(executable - covered), missing_branches)
+    return report
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from google.genai import types
+
+from constants import LOGGER_NAME, CACHE_DIR, CACHE_MAX_BYTES
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+def _json_default(obj):
+    # response schemas are classes (TypedDict), identify them by name and fields
+    if isinstance(obj, type):
+        fields = {name: repr(tp) for name, tp in getattr(obj, "__annotations__", {}).items()}
+        return {"type": obj.__qualname__, "fields": fields}
+    return repr(obj)
+
+
+def conversation_key(model_name: str, config: types.GenerateContentConfig | None, contents: list[types.Content],
+                     sample: int = 0) -> str:
+    payload = {
+        "model": model_name,
+        "config": config.model_dump(exclude_none=True) if config else None,
+        "contents": [content.model_dump(mode="json", exclude_none=True) for content in contents],
+    }
+    if sample:
+        # concurrent samples (best-of-N candidates) of the same conversation are cached separately
+        payload["sample"] = sample
+
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=_json_default).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+        # least recently used entry first (file modification time is bumped on every hit)
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if file.endswith(".json"):
+                    stat = os.stat(os.path.join(root, file))
+                    entries.append((stat.st_mtime, file[:-len(".json")], stat.st_size))
+        self._index: OrderedDict[str, int] = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._size = sum(self._index.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._path(key), "r") as f:
+                    entry = json.load(f)
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                self._size -= self._index.pop(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict):
+        data = json.dumps(entry).encode()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._lock:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            self._size += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+    def get_content(self, key: str) -> tuple[types.Content, str] | None:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return types.Content.model_validate(entry["content"]), entry["text"]
+
+    def put_content(self, key: str, model_name: str, content: types.Content, text: str):
+        self.put(key, {"model": model_name, "created": time.time(), "text": text,
+                       "content": content.model_dump(mode="json", exclude_none=True)})
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "entries": len(self._index), "bytes": self._size}
+
+    def log_stats(self):
+        stats = self.stats()
+        LOGGER.info(f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+                    f"({stats['hit_rate']:.0%} hit rate), {stats['evictions']} evictions, "
+                    f"{stats['entries']} entries ({stats['bytes'] / 1024:.0f}kB)")
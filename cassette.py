@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+from google.genai import types
+
+from cache import conversation_key
+from constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class CassetteMissError(KeyError):
+    pass
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency: str | float | None = None, jitter: float = 0.0,
+                 seed: int = 0):
+        # mode "record" appends every exchange to the cassette, "replay" serves them back without any API call
+        # replay latency: None (instant), "recorded" or a synthetic number of seconds (+- jitter)
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._entries: dict[str, deque[dict]] = defaultdict(deque)
+
+        if self.replaying:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+            LOGGER.info(f"Replaying {sum(len(e) for e in self._entries.values())} recorded responses from {path}")
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            LOGGER.info(f"Recording responses to {path}")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, chat_name: str, model_name: str, config: types.GenerateContentConfig | None,
+               contents: list[types.Content], sample: int, res: types.GenerateContentResponse, elapsed: float):
+        entry = {
+            "key": conversation_key(model_name, config, contents, sample),
+            "chat": chat_name,
+            "model": model_name,
+            "request": contents[-1].model_dump(mode="json", exclude_none=True),
+            "response": res.model_dump(mode="json", exclude_none=True),
+            "latency": elapsed,
+        }
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _next(self, model_name: str, config: types.GenerateContentConfig | None, contents: list[types.Content],
+              sample: int) -> tuple[types.GenerateContentResponse, float]:
+        key = conversation_key(model_name, config, contents, sample)
+        with self._lock:
+            if not self._entries[key]:
+                raise CassetteMissError(f"No recorded response left for conversation {key[:12]} in {self.path}")
+            entry = self._entries[key].popleft()
+
+            if self.latency is None:
+                delay = 0.0
+            elif self.latency == "recorded":
+                delay = entry["latency"]
+            else:
+                delay = float(self.latency)
+            if self.jitter:
+                delay = max(0.0, delay + self._random.uniform(-self.jitter, self.jitter))
+
+        return types.GenerateContentResponse.model_validate(entry["response"]), delay
+
+    def replay(self, model_name: str, config: types.GenerateContentConfig | None, contents: list[types.Content],
+               sample: int = 0) -> types.GenerateContentResponse:
+        res, delay = self._next(model_name, config, contents, sample)
+        time.sleep(delay)
+        return res
+
+    async def replay_async(self, model_name: str, config: types.GenerateContentConfig | None,
+                           contents: list[types.Content], sample: int = 0) -> types.GenerateContentResponse:
+        res, delay = self._next(model_name, config, contents, sample)
+        await asyncio.sleep(delay)
+        return res
@@ -0,0 +1,60 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+from google.genai import types
+
+from constants import CHECKPOINT_DIR
+from results import ExecutionResult
+from utils import project_key
+
+# phases of an iteration, in order
+GENERATED = "generated"
+EXECUTED = "executed"
+EVALUATED = "evaluated"
+
+
+@dataclass
+class PipelineState:
+    iteration: int = 0  # 0 is the initial test suite
+    phase: str | None = None  # last completed phase of the iteration
+    finished: bool = False
+    tests: str | None = None
+    execution: ExecutionResult | None = None
+    stats: dict | None = None
+    estimated: bool = False  # the score of stats was found locally or predicted, not by the evaluator
+    convergence: dict | None = None
+    gen_history: list[types.Content] = field(default_factory=list)
+    eval_history: list[types.Content] = field(default_factory=list)
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def for_project(cls, project_dir: str):
+        return cls(os.path.join(CHECKPOINT_DIR, f"{project_key(project_dir)}.json"))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self, state: PipelineState):
+        data = asdict(state)
+        data["gen_history"] = [content.model_dump(mode="json", exclude_none=True) for content in state.gen_history]
+        data["eval_history"] = [content.model_dump(mode="json", exclude_none=True) for content in state.eval_history]
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def load(self) -> PipelineState:
+        with open(self.path, "r") as f:
+            data = json.load(f)
+
+        data["gen_history"] = [types.Content.model_validate(content) for content in data["gen_history"]]
+        data["eval_history"] = [types.Content.model_validate(content) for content in data["eval_history"]]
+        if data["execution"] is not None:
+            data["execution"] = ExecutionResult.from_dict(data["execution"])
+        return PipelineState(**data)
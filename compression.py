@@ -0,0 +1,135 @@
+import json
+import logging
+from dataclasses import dataclass, field
+
+from branch_coverage import CoverageReport
+from constants import LOGGER_NAME, EXECUTION_TOKEN_BUDGET
+from mutants import MutationReport, NOT_COVERED
+from rate_limiter import CHARS_PER_TOKEN
+from results import ExecutionResult, PASSED, SKIPPED, short_id
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+PROMPT_HEADER = ("The execution of the test suite yielded the following result (failing tests grouped by exception and "
+                 "the innermost frame of the project it was raised in, with one representative traceback per group):")
+
+# detail kept per compression level: passed test names, characters of messages and output, groups with a traceback,
+# test names per group, uncovered branches and surviving mutants
+LEVELS = [(True, 1000, 1000, None, None, None), (False, 300, 200, None, None, 30), (False, 200, 0, 3, 20, 10),
+          (False, 120, 0, 0, 5, 5)]
+
+
+@dataclass
+class FailureGroup:
+    outcome: str
+    exception: str | None
+    frame: str | None
+    source: str | None
+    message: str | None  # of the representative, the first test of the group
+    traceback: str | None
+    output: str
+    tests: list[str] = field(default_factory=list)
+    messages: set[str] = field(default_factory=set)
+
+
+def group_failures(execution: ExecutionResult) -> list[FailureGroup]:
+    # failures with the same exception raised at the same frame are one problem, largest groups first
+    groups: dict[tuple, FailureGroup] = {}
+    for test in execution.problems():
+        key = (test.outcome, test.exception, test.frame)
+        if key not in groups:
+            groups[key] = FailureGroup(test.outcome, test.exception, test.frame, test.source, test.message,
+                                       test.traceback, test.output)
+        groups[key].tests.append(short_id(test.test))
+        if test.message:
+            groups[key].messages.add(test.message)
+
+    return sorted(groups.values(), key=lambda group: -len(group.tests))
+
+
+def _truncate(text: str | None, limit: int) -> str | None:
+    if not text or len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} characters truncated]"
+
+
+def _group_data(group: FailureGroup, message_chars: int, output_chars: int, with_traceback: bool,
+                test_names: int | None) -> dict:
+    tests = group.tests
+    if test_names is not None and len(tests) > test_names:
+        tests = tests[:test_names] + [f"... {len(tests) - test_names} more tests"]
+    data = {"tests": tests, "outcome": group.outcome, "exception": group.exception,
+            "message": _truncate(group.message, message_chars), "frame": group.frame, "source": group.source}
+    if len(group.messages) > 1:
+        data["distinct_messages"] = len(group.messages)
+    if with_traceback:
+        data["traceback"] = group.traceback
+    if output_chars:
+        data["output"] = _truncate(group.output, output_chars)
+    return {key: value for key, value in data.items() if value}
+
+
+def _coverage_data(coverage: CoverageReport, branches: int | None) -> dict:
+    missing = coverage.missing_branches()
+    if branches is not None and len(missing) > branches:
+        missing = missing[:branches] + [f"... {len(missing) - branches} more uncovered branches"]
+    data = {"summary": coverage.summary(), "uncovered_branches": missing}
+    if branches is None:
+        data["uncovered_lines"] = coverage.missing_lines()
+    return {key: value for key, value in data.items() if value}
+
+
+def _mutation_data(mutation: MutationReport, mutants: int | None) -> dict:
+    surviving = [f"{mutant} (never executed)" if mutant.status == NOT_COVERED else str(mutant)
+                 for mutant in mutation.surviving()]
+    if mutants is not None and len(surviving) > mutants:
+        surviving = surviving[:mutants] + [f"... {len(surviving) - mutants} more surviving mutants"]
+    return {key: value for key, value in {"summary": mutation.summary(), "surviving_mutants": surviving}.items()
+            if value}
+
+
+def _prompt(execution: ExecutionResult, groups: list[FailureGroup], level: int, omitted: int) -> str:
+    passed_names, message_chars, output_chars, tracebacks, test_names, branches = LEVELS[level]
+    data = {"summary": execution.counts()}
+    if execution.error:
+        data["error"] = _truncate(execution.error, 4 * message_chars)
+    if execution.output and output_chars:
+        data["output"] = _truncate(execution.output, output_chars)
+    if passed_names:
+        data["passed"] = [short_id(test.test) for test in execution.tests if test.outcome == PASSED]
+    data["problems"] = [_group_data(group, message_chars, output_chars, tracebacks is None or index < tracebacks,
+                                    test_names) for index, group in enumerate(groups)]
+    if omitted:
+        shown = sum(len(group.tests) for group in groups)
+        data["omitted_problems"] = (f"{omitted} more groups of failing tests ({shown} of {len(execution.problems())} "
+                                    f"failing tests shown)")
+    skipped = [f"{short_id(test.test)}: {test.message}" for test in execution.tests if test.outcome == SKIPPED]
+    if skipped:
+        data["skipped"] = skipped
+    if execution.coverage is not None:
+        data["coverage"] = _coverage_data(execution.coverage, branches)
+    if execution.mutation is not None:
+        data["mutation"] = _mutation_data(execution.mutation, branches)
+    if execution.tokens is not None:
+        data["tokens"] = {"summary": execution.tokens.summary(), "untested": execution.tokens.missing()}
+
+    return f"{PROMPT_HEADER}\n```json\n{json.dumps(data)}\n```\n"
+
+
+def execution_prompt(execution: ExecutionResult, token_budget: int = EXECUTION_TOKEN_BUDGET) -> str:
+    # least compressed rendering within the budget, the smallest groups are dropped if nothing else fits
+    groups = group_failures(execution)
+    budget = token_budget * CHARS_PER_TOKEN
+    for level in range(len(LEVELS)):
+        prompt = _prompt(execution, groups, level, 0)
+        if len(prompt) <= budget:
+            break
+    else:
+        shown = len(groups)
+        while shown > 1 and len(prompt) > budget:
+            shown -= 1
+            prompt = _prompt(execution, groups[:shown], len(LEVELS) - 1, len(groups) - shown)
+
+    LOGGER.debug(f"Execution result of {len(execution.problems())} failing tests in {len(groups)} groups compressed "
+                 f"to ~{len(prompt) // CHARS_PER_TOKEN} tokens (level {level})")
+    return prompt
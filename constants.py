@@ -1,5 +1,89 @@
 import logging
 
+PROJECT_DIR = "project"
+
 MODEL_NAME = "gemini-2.0-flash"
 
+# (requests per min, tokens per min) of the Google AI Studio free tier
+RATE_LIMITS = {
+    "gemini-2.0-flash": (15, 1_000_000),
+}
+MAX_RETRIES = 5
+MOCK_SERVER_PORT = 8765
+# project files are sent "inline" (every message), once per conversation ("history") or via the API "cache"
+CONTEXT_MODE = "history"
+CONTEXT_CACHE_TTL = "3600s"
+
+# content-addressed cache of model responses (least recently used entries are evicted beyond the size limit)
+CACHE_DIR = ".cache/responses"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+LOGGER_NAME = "TestSuiteGen"
 LOGGING_LEVEL = logging.DEBUG
+
+CHECKPOINT_DIR = "logs/checkpoints"
+
+# test suites run in a new "subprocess" per execution, in a "warm" worker with the project already imported,
+# in a child forked from a "forkserver" with the project already imported or split into "sharded" forked children
+# running in parallel (the forking executors fall back to "warm" without os.fork)
+EXECUTOR = "sharded"
+FORK_SERVER_START_TIMEOUT = 30
+TEST_DURATIONS_DIR = ".cache/durations"
+SHARD_MIN_SECONDS = 0.5  # expected run time worth another shard
+DEFAULT_TEST_SECONDS = 0.05  # expected run time of a test never run before
+TEST_RESULT_CACHE_DIR = ".cache/test_results"
+TEST_RESULT_CACHE_SIZE = 10_000  # test outcomes kept per project
+IMPACT_DIR = ".cache/impact"
+# every execution is supervised: wall-clock and CPU seconds of a run, address space of the test process and wall-clock
+# seconds of a single test (the test runs out of time, the remaining tests still run)
+EXECUTION_TIMEOUT = 120
+EXECUTION_CPU_SECONDS = 120
+EXECUTION_MEMORY_BYTES = 2 * 1024 ** 3
+TEST_TIMEOUT = 10
+# mutants of src are run against the tests executing the mutated line, a mutant times out after this many times the run
+# time of its tests in an unmutated run of the same harness (forking and importing src included) in CPU seconds, at
+# least one; mutants hanging without using the CPU are stopped by a wall-clock limit MUTANT_MIN_TIMEOUT seconds beyond
+MUTATION_TESTING = True
+MUTANT_TIMEOUT_FACTOR = 3
+MUTANT_MIN_TIMEOUT = 1.0
+# reports by suite and sources, an unchanged suite of unchanged sources is not mutation tested again
+MUTATION_CACHE_DIR = ".cache/mutation"
+MUTATION_CACHE_SIZE = 1000
+# the token kinds, compound operators and line/column edge cases the tests make the lexer handle are matched against the
+# token classes and enums of this module
+TOKEN_MODULE = "src/tokens.py"
+
+# execution results sent to the evaluator are compressed to roughly this many tokens
+EXECUTION_TOKEN_BUDGET = 1500
+
+SCORE_THRESHOLD = 90
+# the evaluator only judges executions whose outcome is not clear locally: a suite that can not run or without a passing
+# test scores LOCAL_REJECT_SCORE, an all-green suite covering every line and branch of src that kills at least
+# LOCAL_ACCEPT_MUTATION_SCORE percent of the mutants (if mutation testing runs) scores LOCAL_ACCEPT_SCORE
+LOCAL_DECISION = True
+LOCAL_REJECT_SCORE = 0
+LOCAL_ACCEPT_SCORE = 95
+LOCAL_ACCEPT_MUTATION_SCORE = 90
+# the score of any other execution is predicted by a ridge regression on its local results, trained from the evaluator
+# scores in logs/ and the score history; the evaluator is asked while fewer than PREDICTOR_MIN_SAMPLES scores are known,
+# if the confidence interval is wider than +-PREDICTOR_MAX_INTERVAL points or contains SCORE_THRESHOLD and after
+# PREDICTOR_MAX_CONSECUTIVE predicted scores in a row
+SCORE_PREDICTOR = True
+SCORE_HISTORY = "logs/scores.jsonl"
+PREDICTOR_MIN_SAMPLES = 20
+PREDICTOR_MAX_INTERVAL = 10
+PREDICTOR_CONFIDENCE_Z = 1.645  # 90% interval
+PREDICTOR_RIDGE = 1.0
+PREDICTOR_MAX_CONSECUTIVE = 2
+MAX_ITERATIONS = 10
+# early stopping: expected score points per API call (estimated over a window of iterations) worth another iteration
+CONVERGENCE_MIN_GAIN = 1.0
+CONVERGENCE_WINDOW = 3
+CONVERGENCE_SWITCH_CANDIDATES = 3
+
+# best-of-N: candidate suites generated per iteration, selected by "local" execution results or "evaluator" score
+CANDIDATES = 1
+CANDIDATE_SELECTION = "local"
+
+# projects processed concurrently by batch.py
+BATCH_WORKERS = 4
@@ -0,0 +1,91 @@
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+
+from constants import CONVERGENCE_MIN_GAIN, CONVERGENCE_WINDOW
+from results import ExecutionResult
+
+
+class Decision(Enum):
+    CONTINUE = "continue"
+    SWITCH = "switch"  # progress stalled, try another generation strategy first
+    STOP = "stop"
+
+
+@dataclass
+class IterationRecord:
+    score: int
+    tests: int
+    failures: int
+    api_calls: int
+    estimated: bool = False  # scored locally or by the score predictor, not by the evaluator
+
+
+@dataclass
+class ConvergenceDetector:
+    min_gain: float = CONVERGENCE_MIN_GAIN  # expected score points per API call
+    window: int = CONVERGENCE_WINDOW  # iterations the trend is estimated from
+    records: list[IterationRecord] = field(default_factory=list)
+    switched_at: int | None = None  # number of evaluator scored records when the strategy was switched
+
+    def record(self, score: int, execution: ExecutionResult | None, api_calls: int, estimated: bool = False):
+        counts = (execution or ExecutionResult()).counts()
+        self.records.append(IterationRecord(score, counts["ran"], counts["failures"] + counts["errors"],
+                                            max(api_calls, 1), estimated))
+
+    def _scored(self) -> list[IterationRecord]:
+        # estimated scores are on another scale than the evaluator's, mixing them into the trend makes up gains and
+        # losses; their API calls still count
+        scored, calls = [], 0
+        for record in self.records:
+            calls += record.api_calls
+            if not record.estimated:
+                scored.append(IterationRecord(record.score, record.tests, record.failures, calls))
+                calls = 0
+        return scored
+
+    @staticmethod
+    def _slope(values: list[float]) -> float:
+        # least squares slope over equidistant iterations
+        n = len(values)
+        mean_x, mean_y = (n - 1) / 2, sum(values) / n
+        variance = sum((x - mean_x) ** 2 for x in range(n))
+        return sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / variance
+
+    def expected_gain(self) -> float | None:
+        # expected score gain per API call of the next iteration
+        recent = self._scored()[-self.window:]
+        if len(recent) < max(self.window, 2):
+            return None
+        calls_per_iteration = sum(record.api_calls for record in recent[1:]) / (len(recent) - 1)
+        return self._slope([record.score for record in recent]) / calls_per_iteration
+
+    def _still_improving(self) -> bool:
+        # fewer failing tests may pay off in later scores; a growing suite does not, the generator adds tests in
+        # almost every iteration and whatever they are worth is already part of the scores
+        scored = self._scored()
+        first, last = scored[-self.window], scored[-1]
+        return last.failures < first.failures
+
+    def decide(self) -> Decision:
+        if self.records and self.records[-1].estimated:
+            return Decision.CONTINUE  # nothing new about the trend
+        gain = self.expected_gain()
+        if gain is None or gain >= self.min_gain or self._still_improving():
+            return Decision.CONTINUE
+
+        scored = len(self._scored())
+        if self.switched_at is None:
+            self.switched_at = scored
+            return Decision.SWITCH
+        if scored - self.switched_at >= self.window:
+            return Decision.STOP
+        return Decision.CONTINUE  # give the switched strategy a full window
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        data = dict(data)
+        data["records"] = [IterationRecord(**record) for record in data["records"]]
+        return cls(**data)
@@ -0,0 +1,98 @@
+import logging
+
+from compression import group_failures
+from constants import LOGGER_NAME, LOCAL_REJECT_SCORE, LOCAL_ACCEPT_SCORE, LOCAL_ACCEPT_MUTATION_SCORE
+from results import ExecutionResult
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+# failure groups, uncovered branches and surviving mutants listed in locally written feedback
+MAX_GROUPS = 5
+MAX_FINDINGS = 10
+
+
+def _error_tail(error: str, limit: int = 1000) -> str:
+    # the end of a traceback names the problem
+    return error.strip() if len(error) <= limit else "... " + error.strip()[-limit:]
+
+
+def _group_lines(execution: ExecutionResult) -> list[str]:
+    groups = group_failures(execution)
+    lines = [f"- {len(group.tests)} tests: {group.exception or group.outcome} at {group.frame}: {group.message}"
+             for group in groups[:MAX_GROUPS]]
+    if len(groups) > MAX_GROUPS:
+        lines.append(f"- ... {len(groups) - MAX_GROUPS} more groups of failing tests")
+    return lines
+
+
+def _listed(findings: list, noun: str) -> list[str]:
+    lines = [f"- {finding}" for finding in findings[:MAX_FINDINGS]]
+    if len(findings) > MAX_FINDINGS:
+        lines.append(f"- ... {len(findings) - MAX_FINDINGS} more {noun}")
+    return lines
+
+
+def _broken(execution: ExecutionResult) -> str | None:
+    counts = execution.counts()
+    if counts["ran"] == 0 and execution.error:
+        return (f"The test suite could not be executed:\n{_error_tail(execution.error)}\n"
+                f"Fix the test suite so that tests.py can be imported and its tests run.")
+    if counts["ran"] == 0:
+        return "The test suite does not contain a single test. Write unittest test methods for the project."
+    if counts["passed"] == 0:
+        return (f"None of the {counts['ran']} tests of the test suite passes:\n" + "\n".join(_group_lines(execution))
+                + "\nConsider the project files to hold the correct behavior and fix the test suite accordingly.")
+    return None
+
+
+def _complete(execution: ExecutionResult) -> str | None:
+    counts = execution.counts()
+    if execution.error or execution.problems() or counts["skipped"] or execution.coverage is None:
+        return None
+    totals = execution.coverage.totals()
+    if totals["covered_lines"] < totals["lines"] or totals["covered_branches"] < totals["branches"]:
+        return None
+    # without mutation testing (--no-mutation) full coverage alone decides
+    if execution.mutation is None:
+        return f"All {counts['ran']} tests pass and cover every line and branch of src/."
+    if execution.mutation.score() < LOCAL_ACCEPT_MUTATION_SCORE:
+        return None
+    surviving = _listed(execution.mutation.surviving(), "mutants")
+    return (f"All {counts['ran']} tests pass, cover every line and branch of src/ and detect "
+            f"{execution.mutation.score():.0f}% of its mutants."
+            + ("\nMutants no test detects:\n" + "\n".join(surviving) if surviving else ""))
+
+
+def local_feedback(execution: ExecutionResult) -> str:
+    # feedback written from the local results, for scores decided without the evaluator
+    counts = execution.counts()
+    parts = []
+    if execution.error:
+        parts.append(f"The test suite could not be run completely:\n{_error_tail(execution.error, 500)}")
+    if execution.problems():
+        parts.append(f"{len(execution.problems())} of {counts['ran']} tests fail (consider the project files to hold "
+                     f"the correct behavior):\n" + "\n".join(_group_lines(execution)))
+    if execution.coverage is not None and execution.coverage.missing_branches():
+        parts.append("Decision branches no test takes:\n"
+                     + "\n".join(_listed(execution.coverage.missing_branches(), "branches")))
+    if execution.mutation is not None and execution.mutation.surviving():
+        parts.append("Changes of src/ no test detects (surviving mutants):\n"
+                     + "\n".join(_listed(execution.mutation.surviving(), "mutants")))
+    return "\n".join(parts) or f"All {counts['ran']} tests pass."
+
+
+def decide_locally(execution: ExecutionResult | None) -> dict | None:
+    # score and feedback of an execution whose outcome is clear from the local results alone (a suite that can not
+    # run or an all-green run at full coverage), None if it has to be judged by the evaluator
+    if execution is None:
+        return None
+    feedback = _broken(execution)
+    if feedback is not None:
+        LOGGER.info(f"Test suite scored {LOCAL_REJECT_SCORE} locally without the evaluator: it does not work")
+        return {"score": LOCAL_REJECT_SCORE, "feedback": feedback}
+    feedback = _complete(execution)
+    if feedback is not None:
+        LOGGER.info(f"Test suite scored {LOCAL_ACCEPT_SCORE} locally without the evaluator: it passes at full "
+                    f"coverage")
+        return {"score": LOCAL_ACCEPT_SCORE, "feedback": feedback}
+    return None
@@ -0,0 +1,581 @@
+import asyncio
+import contextlib
+import heapq
+import importlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import pkgutil
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from multiprocessing.connection import Client, Listener
+from typing import Protocol
+
+from constants import LOGGER_NAME, FORK_SERVER_START_TIMEOUT, TEST_DURATIONS_DIR, SHARD_MIN_SECONDS, \
+    DEFAULT_TEST_SECONDS
+from impact import ImpactMap
+from result_cache import TestResultCache, test_keys
+from results import ExecutionResult, ResultCollector, format_exception, project_roots
+from sandbox import Sandbox
+from supervisor import ExecutionLimits, apply_resource_limits, crash_message, journal_file, partial_result, \
+    timeout_message
+from utils import project_key, read_project_sources, sources_hash
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+EXECUTORS = ("subprocess", "warm", "forkserver", "sharded")
+
+
+class ExecutionError(Exception):
+    pass
+
+
+class Executor(Protocol):
+    # tests with an id in skip are not run, their results are known already
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult: ...
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult: ...
+
+    def close(self): ...
+
+
+def _subprocess_result(returncode: int, stdout: str, stderr: str, journal: str, duration: float) -> ExecutionResult:
+    try:
+        return ExecutionResult.from_dict(json.loads(stdout))
+    except (ValueError, KeyError, TypeError):
+        return partial_result(journal, crash_message(returncode) + stderr, duration)
+
+
+class SubprocessExecutor:
+    # a fresh python process per execution, running this module as a script
+    def __init__(self, limits: ExecutionLimits | None = None):
+        self.limits = limits or ExecutionLimits()
+
+    def _command(self, run_dir: str, skip: set[str] | None, journal: str) -> list[str]:
+        job = {"skip": sorted(skip or ()), "limits": asdict(self.limits), "journal": journal}
+        return [sys.executable, "-B", os.path.abspath(__file__), os.path.abspath(run_dir), json.dumps(job)]
+
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        start = time.perf_counter()
+        with journal_file() as journal:
+            try:
+                execution = subprocess.run(self._command(run_dir, skip, journal), capture_output=True, text=True,
+                                           cwd=run_dir, timeout=self.limits.timeout)
+            except subprocess.TimeoutExpired:
+                return partial_result(journal, timeout_message(self.limits.timeout), time.perf_counter() - start)
+            return _subprocess_result(execution.returncode, execution.stdout, execution.stderr, journal,
+                                      time.perf_counter() - start)
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        start = time.perf_counter()
+        with journal_file() as journal:
+            execution = await asyncio.create_subprocess_exec(*self._command(run_dir, skip, journal), cwd=run_dir,
+                                                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            try:
+                stdout, stderr = await asyncio.wait_for(execution.communicate(), self.limits.timeout)
+            except asyncio.TimeoutError:
+                execution.kill()
+                await execution.wait()
+                return partial_result(journal, timeout_message(self.limits.timeout), time.perf_counter() - start)
+            return _subprocess_result(execution.returncode, stdout.decode(), stderr.decode(), journal,
+                                      time.perf_counter() - start)
+
+    def close(self):
+        pass
+
+
+def _exec_test_module(run_dir: str, name: str) -> types.ModuleType:
+    # compiled from source every time, stale bytecode or a previously imported suite is never reused
+    path = os.path.join(run_dir, f"{name}.py")
+    module = types.ModuleType(name)
+    module.__file__ = path
+    sys.modules[name] = module
+    with open(path, "r") as f:
+        exec(compile(f.read(), path, "exec"), module.__dict__)
+    return module
+
+
+def _iter_tests(suite: unittest.TestSuite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iter_tests(test)
+        else:
+            yield test
+
+
+@contextlib.contextmanager
+def _in_run_dir(run_dir: str, output: io.StringIO):
+    cwd = os.getcwd()
+    try:
+        os.chdir(run_dir)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            yield
+    finally:
+        os.chdir(cwd)
+
+
+def run_tests(run_dir: str, test_ids: list[str] | None = None, skip: set[str] | None = None,
+              limits: ExecutionLimits | None = None, journal: str | None = None,
+              failfast: bool = False) -> ExecutionResult:
+    # runs (the given tests of) <run_dir>/tests.py in this process, which is limited to the given resources
+    apply_resource_limits(limits)
+    result, output = ExecutionResult(), io.StringIO()
+    start = time.perf_counter()
+    with _in_run_dir(run_dir, output):
+        try:
+            module = _exec_test_module(run_dir, "tests")
+        except BaseException as e:
+            result.error = f"Failed to import test module: tests\n{format_exception(e, project_roots(run_dir))}"
+        else:
+            suite = unittest.TestLoader().loadTestsFromModule(module)
+            if test_ids is not None:
+                tests = {test.id(): test for test in _iter_tests(suite)}
+                suite = unittest.TestSuite([tests[test_id] for test_id in test_ids if test_id in tests])
+            if skip:
+                suite = unittest.TestSuite([test for test in _iter_tests(suite) if test.id() not in skip])
+            collector = ResultCollector(run_dir, journal, limits.test_timeout if limits else None)
+            collector.failfast = failfast
+            suite.run(collector)
+            result.tests = collector.outcomes
+
+    result.output, result.duration = output.getvalue(), time.perf_counter() - start
+    return result
+
+
+def collect_test_ids(run_dir: str) -> list[str] | None:
+    # None if <run_dir>/tests.py can not be imported
+    with _in_run_dir(run_dir, io.StringIO()):
+        try:
+            module = _exec_test_module(run_dir, "tests")
+        except BaseException:
+            return None
+        return [test.id() for test in _iter_tests(unittest.TestLoader().loadTestsFromModule(module))]
+
+
+def preload_project(project_dir: str):
+    # import every module of <project_dir>/src (and the unittest machinery) ahead of the first execution
+    sys.path.insert(0, os.path.abspath(project_dir))
+    sys.dont_write_bytecode = True
+    package = importlib.import_module("src")
+    for module in pkgutil.walk_packages(package.__path__, "src."):
+        try:
+            importlib.import_module(module.name)
+        except Exception:
+            pass
+
+
+def _warm_worker(conn, project_dir: str):
+    preload_project(project_dir)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        try:
+            conn.send(run_tests(job[0], skip=job[1], limits=job[2], journal=job[3]))
+        except BaseException:
+            conn.send(ExecutionResult(error=f"Execution of the test suite failed:\n{traceback.format_exc()}"))
+
+
+class WarmExecutor:
+    # long-lived worker with the project already imported, restarted if it dies, runs out of time or the sources
+    # change
+    def __init__(self, project_dir: str, limits: ExecutionLimits | None = None):
+        self.project_dir = project_dir
+        self.limits = limits or ExecutionLimits()
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._sources_hash = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_warm_worker, args=(child_conn, self.project_dir), daemon=True)
+        try:
+            process.start()
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            child_conn.close()
+        # only a started process is ever stopped, a failed start raises its own error
+        self._process, self._conn = process, conn
+        self._sources_hash = sources_hash(self.project_dir)
+        LOGGER.debug(f"Started warm test executor (pid {self._process.pid})")
+
+    def _stop(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.kill()
+        self._conn.close()
+        self._process = self._conn = None
+
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        with self._lock:
+            if self._process is None or not self._process.is_alive() \
+                    or self._sources_hash != sources_hash(self.project_dir):
+                self._stop()
+                self._start()
+
+            start = time.perf_counter()
+            with journal_file() as journal:
+                try:
+                    self._conn.send((os.path.abspath(run_dir), skip, self.limits, journal))
+                    if self._conn.poll(self.limits.timeout):
+                        return self._conn.recv()
+                    self._process.kill()
+                    self._stop()
+                    return partial_result(journal, timeout_message(self.limits.timeout), time.perf_counter() - start)
+                except (EOFError, OSError):
+                    self._process.join(timeout=5)
+                    exit_code = self._process.exitcode
+                    self._stop()
+                    return partial_result(journal, crash_message(exit_code), time.perf_counter() - start)
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, run_dir, skip)
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+
+def _reap_children():
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _run_forked(conn, function, args: tuple, timeout: float | None):
+    # forks once more and waits, so a crashing suite is still answered with its exit code and a hanging one is killed
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                conn.send(("ok", function(*args)))
+            except BaseException:
+                conn.send(("failed", f"Execution of the test suite failed:\n{traceback.format_exc()}"))
+            finally:
+                os._exit(0)
+
+        timed_out = []
+
+        def kill(signum, frame):
+            timed_out.append(signum)
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+
+        if timeout:
+            signal.signal(signal.SIGALRM, kill)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        exit_code = os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        if timed_out:
+            conn.send(("failed", timeout_message(timeout)))
+        elif exit_code != 0:
+            conn.send(("failed", crash_message(exit_code)))
+    finally:
+        os._exit(0)
+
+
+def _fork_server(address: str, authkey: bytes, ready, project_dir: str):
+    preload_project(project_dir)
+    with Listener(address, "AF_UNIX", authkey=authkey) as listener:
+        ready.set()
+        while True:
+            try:
+                conn = listener.accept()
+                job = conn.recv() if conn.poll(5) else ()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                continue
+            if job is None:
+                conn.close()
+                return
+
+            if job and os.fork() == 0:
+                _run_forked(conn, *job)
+            conn.close()
+            _reap_children()
+
+
+class ForkServerExecutor:
+    # zygote with the project already imported, forking a fresh copy-on-write child for every execution
+    def __init__(self, project_dir: str, limits: ExecutionLimits | None = None):
+        self.project_dir = project_dir
+        self.limits = limits or ExecutionLimits()
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._ready = None
+        self._directory = None
+        self._address = None
+        self._authkey = None
+        self._sources_hash = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._directory = tempfile.mkdtemp(prefix="testsuitegen_forkserver_")
+        self._address = os.path.join(self._directory, "socket")
+        self._authkey = os.urandom(32)
+        self._ready = self._context.Event()
+        process = self._context.Process(target=_fork_server, daemon=True,
+                                        args=(self._address, self._authkey, self._ready, self.project_dir))
+        try:
+            process.start()
+        except BaseException:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            raise
+        # only a started process is ever stopped, a failed start raises its own error
+        self._process = process
+        self._sources_hash = sources_hash(self.project_dir)
+        LOGGER.debug(f"Started fork server (pid {self._process.pid})")
+
+    def _stop(self):
+        if self._process is None:
+            return
+        if self._process.is_alive() and self._ready.is_set():
+            try:
+                with Client(self._address, "AF_UNIX", authkey=self._authkey) as conn:
+                    conn.send(None)
+            except (OSError, EOFError):
+                pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.kill()
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self._process = None
+
+    def _server(self) -> tuple[str, bytes] | None:
+        with self._lock:
+            if self._process is None or not self._process.is_alive() \
+                    or self._sources_hash != sources_hash(self.project_dir):
+                self._stop()
+                self._start()
+
+            if not self._ready.wait(FORK_SERVER_START_TIMEOUT) or not self._process.is_alive():
+                self._stop()
+                return None
+            return self._address, self._authkey
+
+    def call(self, function, *args, timeout: float | None = None):
+        # function(*args) in a freshly forked child, killed after timeout seconds; function has to be importable from
+        # this module
+        server = self._server()
+        if server is None:
+            raise ExecutionError(crash_message(None))
+
+        address, authkey = server
+        try:
+            with Client(address, "AF_UNIX", authkey=authkey) as conn:
+                conn.send((function, args, timeout))
+                status, value = conn.recv()
+        except (EOFError, OSError):
+            raise ExecutionError(crash_message(None))
+        if status != "ok":
+            raise ExecutionError(value)
+        return value
+
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        start = time.perf_counter()
+        with journal_file() as journal:
+            try:
+                return self.call(run_tests, os.path.abspath(run_dir), None, skip, self.limits, journal,
+                                 timeout=self.limits.timeout)
+            except ExecutionError as e:
+                return partial_result(journal, str(e), time.perf_counter() - start)
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, run_dir, skip)
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+
+class TestDurations:
+    # exponentially smoothed run time of every test id of a project
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.durations = json.load(f)
+        except (OSError, ValueError):
+            self.durations = {}
+
+    @classmethod
+    def for_project(cls, project_dir: str):
+        return cls(os.path.join(TEST_DURATIONS_DIR, f"{project_key(project_dir)}.json"))
+
+    def get(self, test_id: str) -> float:
+        return self.durations.get(test_id, DEFAULT_TEST_SECONDS)
+
+    def update(self, durations: dict[str, float]):
+        with self._lock:
+            for test_id, duration in durations.items():
+                previous = self.durations.get(test_id)
+                self.durations[test_id] = duration if previous is None else (previous + duration) / 2
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", "w") as f:
+                json.dump(self.durations, f)
+            os.replace(f"{self.path}.tmp", self.path)
+
+
+def balance_shards(test_ids: list[str], expected: list[float], count: int) -> list[list[str]]:
+    # longest expected tests first, each onto the shard with the least expected time so far
+    shards = [(0.0, index, []) for index in range(count)]
+    for position in sorted(range(len(test_ids)), key=lambda i: -expected[i]):
+        total, index, shard = heapq.heappop(shards)
+        shard.append(position)
+        heapq.heappush(shards, (total + expected[position], index, shard))
+
+    return [[test_ids[position] for position in sorted(shard)] for _, _, shard in sorted(shards, key=lambda s: s[1])
+            if shard]
+
+
+class ShardedExecutor:
+    # tests of a suite split into shards balanced by their past run times, each shard forked from a fork server
+    def __init__(self, project_dir: str, workers: int | None = None, limits: ExecutionLimits | None = None):
+        self.project_dir = project_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.limits = limits or ExecutionLimits()
+        self.server = ForkServerExecutor(project_dir, self.limits)
+        self.durations = TestDurations.for_project(project_dir)
+
+    def _run_shard(self, run_dir: str, test_ids: list[str], isolated: bool) -> ExecutionResult:
+        start = time.perf_counter()
+        with journal_file() as journal:
+            try:
+                if not isolated:
+                    return self.server.call(run_tests, run_dir, test_ids, None, self.limits, journal,
+                                            timeout=self.limits.timeout)
+                # every shard gets its own sandbox, tests write their input files to the cwd
+                with Sandbox(run_dir) as shard_dir:
+                    return self.server.call(run_tests, shard_dir, test_ids, None, self.limits, journal,
+                                            timeout=self.limits.timeout)
+            except ExecutionError as e:
+                return partial_result(journal, f"{e}while running the tests {', '.join(test_ids)}\n",
+                                      time.perf_counter() - start)
+
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        run_dir = os.path.abspath(run_dir)
+        start = time.perf_counter()
+        try:
+            test_ids = self.server.call(collect_test_ids, run_dir, timeout=self.limits.timeout)
+        except ExecutionError as e:
+            return ExecutionResult(error=str(e))
+        if test_ids is None:
+            return self.server.run(run_dir)  # reports why tests.py can not be imported
+        test_ids = [test_id for test_id in test_ids if test_id not in (skip or ())]
+        if not test_ids:
+            return ExecutionResult(duration=time.perf_counter() - start)
+
+        expected = [self.durations.get(test_id) for test_id in test_ids]
+        count = max(1, min(self.workers, len(test_ids), int(sum(expected) / SHARD_MIN_SECONDS)))
+        shards = balance_shards(test_ids, expected, count)
+        if len(shards) == 1:
+            reports = [self._run_shard(run_dir, test_ids, False)]
+        else:
+            with ThreadPoolExecutor(len(shards)) as pool:
+                reports = list(pool.map(lambda shard: self._run_shard(run_dir, shard, True), shards))
+        LOGGER.debug(f"Ran {len(test_ids)} tests in {len(shards)} shards")
+
+        self.durations.update({test.test: test.duration for report in reports for test in report.tests})
+        return ExecutionResult.merge(reports, time.perf_counter() - start)
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, run_dir, skip)
+
+    def close(self):
+        self.server.close()
+
+
+class CachedExecutor:
+    # reuses the outcomes of test methods that did not change since they last ran against the same sources, and of
+    # those that did not execute any changed line of src since they last ran
+    def __init__(self, executor: Executor, project_dir: str, cache: TestResultCache | None = None,
+                 impact: ImpactMap | None = None):
+        self.executor = executor
+        self.cache = cache or TestResultCache.for_project(project_dir)
+        self.impact = impact or ImpactMap.for_project(project_dir)
+
+    def _lookup(self, run_dir: str, skip: set[str] | None) -> tuple[dict[str, str], dict[str, str], dict, dict]:
+        try:
+            with open(os.path.join(run_dir, "tests.py"), "r") as f:
+                tests_str = f.read()
+        except OSError:
+            return {}, {}, {}, {}
+        sources = {f"src/{path}": content for path, content in read_project_sources(run_dir).items()}
+        keys, method_keys = test_keys(tests_str, sources_hash(run_dir)), test_keys(tests_str, "")
+        wanted = {test_id: key for test_id, key in keys.items() if test_id not in (skip or ())}
+        cached = self.cache.get_all(wanted)
+        uncached = {test_id: method_keys[test_id] for test_id in wanted if test_id not in cached}
+        unaffected = self.impact.unaffected(uncached, sources)
+        LOGGER.info(f"Reused {len(cached)} of {len(keys)} test results from the test result cache, "
+                    f"{len(unaffected)} of the other {len(uncached)} tests not affected by source changes")
+        return keys, method_keys, sources, cached | unaffected
+
+    def _merge(self, lookup: tuple, result: ExecutionResult) -> ExecutionResult:
+        keys, method_keys, sources, reused = lookup
+        self.cache.put_all(keys, result.tests + list(reused.values()))
+        self.impact.update(method_keys, result.tests, sources)
+        order = {test_id: index for index, test_id in enumerate(keys)}
+        result.tests = sorted(result.tests + list(reused.values()), key=lambda test: order.get(test.test, len(order)))
+        return result
+
+    def run(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        lookup = self._lookup(run_dir, skip)
+        return self._merge(lookup, self.executor.run(run_dir, set(lookup[3]) | (skip or set())))
+
+    async def run_async(self, run_dir: str, skip: set[str] | None = None) -> ExecutionResult:
+        lookup = self._lookup(run_dir, skip)
+        return self._merge(lookup, await self.executor.run_async(run_dir, set(lookup[3]) | (skip or set())))
+
+    def close(self):
+        self.executor.close()
+        self.cache.log_stats()
+        self.impact.log_stats()
+
+
+def create_executor(name: str, project_dir: str, cache_results: bool = True, limits: ExecutionLimits | None = None):
+    if name == "sharded" and hasattr(os, "fork"):
+        executor = ShardedExecutor(project_dir, limits=limits)
+    elif name == "forkserver" and hasattr(os, "fork"):
+        executor = ForkServerExecutor(project_dir, limits)
+    elif name in ("warm", "forkserver", "sharded"):
+        executor = WarmExecutor(project_dir, limits)
+    else:
+        executor = SubprocessExecutor(limits)
+    return CachedExecutor(executor, project_dir) if cache_results else executor
+
+
+if __name__ == "__main__":
+    # used by SubprocessExecutor: runs the tests.py of the given directory and prints the result as JSON
+    run_dir, job = sys.argv[1], json.loads(sys.argv[2])
+    sys.path.insert(0, run_dir)
+    print(json.dumps(run_tests(run_dir, skip=set(job["skip"]), limits=ExecutionLimits(**job["limits"]),
+                               journal=job["journal"]).to_dict()))
@@ -0,0 +1,165 @@
+import ast
+import difflib
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, replace
+
+from constants import LOGGER_NAME, IMPACT_DIR, TEST_RESULT_CACHE_SIZE
+from results import TestOutcome, is_complete
+from tracing import EXIT
+from utils import parse_source, project_key
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+def _statement_starts(tree: ast.AST) -> dict[int, int]:
+    # first line of the innermost statement every line belongs to (else: and continuation lines included)
+    starts = {}
+    for node in ast.walk(tree):  # breadth first, inner statements override the lines of outer ones
+        if isinstance(node, ast.stmt):
+            for line in range(node.lineno, (node.end_lineno or node.lineno) + 1):
+                starts[line] = node.lineno
+    return starts
+
+
+def _function_bodies(tree: ast.AST) -> dict[int, int]:
+    # lines only executed when a function is called and the indentation of their body, everything else runs while
+    # importing
+    lines = {}
+    for node in ast.walk(tree):  # nested functions override the lines of outer ones
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.update(dict.fromkeys(range(node.body[0].lineno, node.end_lineno + 1), node.body[0].col_offset))
+    return lines
+
+
+def _indentation(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _is_code(line: str) -> bool:
+    return bool(line.strip()) and not line.strip().startswith("#")
+
+
+class SourceDiff:
+    # changed statements between two versions of the sources under test ({path: content}) and where unchanged
+    # lines moved to
+    def __init__(self, old: dict[str, str], new: dict[str, str]):
+        self.changed: dict[str, set[int]] = {}
+        self.moved: dict[str, dict[int, int]] = {}
+        self.starts: dict[str, dict[int, int]] = {}
+        self.global_change = False  # module level code changed, every test may be affected
+
+        for path, content in old.items():
+            try:
+                tree = parse_source(content)
+            except SyntaxError:
+                self.global_change = True
+                continue
+            old_lines, new_lines = content.splitlines(), new.get(path, "").splitlines()
+            self.starts[path], bodies = _statement_starts(tree), _function_bodies(tree)
+            self.changed[path], self.moved[path] = set(), {}
+
+            matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == "equal":
+                    self.moved[path].update({i1 + k + 1: j1 + k + 1 for k in range(i2 - i1)})
+                    continue
+                if not any(_is_code(line) for line in old_lines[i1:i2] + new_lines[j1:j2]):
+                    continue  # blank lines and comments only
+
+                # inserted lines affect whatever runs right before and after them within the same function
+                lines = range(i1 + 1, i2 + 1) if i2 > i1 else [line for line in (i1, i1 + 1) if line in bodies]
+                if not lines or any(line not in bodies for line in lines):
+                    self.global_change = True
+                    continue
+                indentation = min(bodies[line] for line in lines)
+                if any(_indentation(line) < indentation for line in new_lines[j1:j2] if _is_code(line)):
+                    self.global_change = True  # code moved out of the function
+                self.changed[path].update(self.starts[path].get(line, line) for line in lines)
+
+    def affects(self, lines: dict[str, list[int]]) -> bool:
+        if self.global_change:
+            return True
+        for path, covered in lines.items():
+            starts = self.starts.get(path, {})
+            if {starts.get(line, line) for line in covered} & self.changed.get(path, set()):
+                return True
+        return False
+
+    def move(self, lines: dict[str, list[int]]) -> dict[str, list[int]]:
+        # line numbers of an unaffected test in the new version of the sources
+        return {path: sorted(self.moved[path][line] for line in covered if line in self.moved[path])
+                if path in self.moved else covered for path, covered in lines.items()}
+
+    def move_arcs(self, arcs: dict[str, list[list[int]]]) -> dict[str, list[list[int]]]:
+        moved = {}
+        for path, covered in arcs.items():
+            if path not in self.moved:
+                moved[path] = covered
+                continue
+            lines = {**self.moved[path], EXIT: EXIT}
+            moved[path] = sorted([lines[start], lines[end]] for start, end in covered
+                                 if start in lines and end in lines)
+        return moved
+
+
+class ImpactMap:
+    # outcome and covered src lines of every test, by its src independent test key, for the sources it last ran
+    # against; after a change of the sources only tests that covered changed lines have to run again
+    def __init__(self, path: str, max_entries: int = TEST_RESULT_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._reused = 0
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.sources, self.tests = data["sources"], data["tests"]
+        except (OSError, ValueError, KeyError):
+            self.sources, self.tests = {}, {}
+
+    @classmethod
+    def for_project(cls, project_dir: str):
+        return cls(os.path.join(IMPACT_DIR, f"{project_key(project_dir)}.json"))
+
+    def unaffected(self, keys: dict[str, str], sources: dict[str, str]) -> dict[str, TestOutcome]:
+        # outcomes that still hold for the given sources, with their lines moved to the new line numbers
+        with self._lock:
+            diff = SourceDiff(self.sources, sources) if sources != self.sources else None
+            outcomes = {}
+            for test_id, key in keys.items():
+                entry = self.tests.get(key)
+                if entry is None or not entry["lines"] or not is_complete(entry) or \
+                        (diff and diff.affects(entry["lines"])):
+                    continue
+                outcome = TestOutcome(**entry)
+                if diff:
+                    outcome = replace(outcome, lines=diff.move(outcome.lines), arcs=diff.move_arcs(outcome.arcs))
+                outcomes[test_id] = replace(outcome, test=test_id)
+            self._reused += len(outcomes)
+            return outcomes
+
+    def update(self, keys: dict[str, str], outcomes: list[TestOutcome], sources: dict[str, str]):
+        with self._lock:
+            if sources != self.sources:
+                diff = SourceDiff(self.sources, sources)
+                self.tests = {key: dict(entry, lines=diff.move(entry["lines"]),
+                                        arcs=diff.move_arcs(entry.get("arcs", {})))
+                              for key, entry in self.tests.items() if not diff.affects(entry["lines"])}
+                self.sources = sources
+            for outcome in outcomes:
+                if outcome.test in keys:
+                    self.tests.pop(keys[outcome.test], None)
+                    self.tests[keys[outcome.test]] = asdict(outcome)
+            for key in list(self.tests)[:max(0, len(self.tests) - self.max_entries)]:
+                del self.tests[key]
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", "w") as f:
+                json.dump({"sources": self.sources, "tests": self.tests}, f)
+            os.replace(f"{self.path}.tmp", self.path)
+
+    def log_stats(self):
+        LOGGER.info(f"Test impact analysis: {self._reused} results of tests not affected by source changes reused")
@@ -0,0 +1,200 @@
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import LOGGER_NAME, MOCK_SERVER_PORT
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+MODEL_PATH = re.compile(r"^/[^/]+/models/(?P<model>[^/:]+):(?P<method>\w+)$")
+
+SUITE_TEMPLATE = """import unittest
+
+
+class GeneratedTest(unittest.TestCase):
+{tests}
+
+if __name__ == "__main__":
+    unittest.main()
+"""
+TEST_TEMPLATE = """    def test_generated_{index}(self):
+        self.assertEqual({index}, {index})
+"""
+
+
+class MockGemini:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, requests_per_min: int | None = None, suites: list[str] | None = None,
+                 base_score: int = 40, score_step: int = 10, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_min = requests_per_min
+        self.suites = suites or []
+        self.base_score = base_score
+        self.score_step = score_step
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self.stats = {"requests": 0, "responses": 0, "rate_limited": 0, "errors": 0}
+
+    def _draw(self) -> tuple[float, float]:
+        with self._lock:
+            return self._random.random(), self._random.uniform(-self.jitter, self.jitter)
+
+    def _quota_exceeded(self) -> bool:
+        if self.requests_per_min is None:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            while self._requests and now - self._requests[0] >= 60:
+                self._requests.popleft()
+            if len(self._requests) >= self.requests_per_min:
+                return True
+            self._requests.append(now)
+            return False
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _suite(self, turn: int) -> str:
+        if self.suites:
+            return self.suites[(turn - 1) % len(self.suites)]
+        tests = "\n".join(TEST_TEMPLATE.format(index=index) for index in range(turn * 5))
+        return SUITE_TEMPLATE.format(tests=tests)
+
+    def _evaluation(self, turn: int) -> str:
+        score = min(100, self.base_score + (turn - 1) * self.score_step)
+        return json.dumps({"score": score, "feedback": f"Mock evaluation of turn {turn}: the test suite misses "
+                                                       f"some decision branches of the lexer."})
+
+    def generate_content(self, model: str, body: dict) -> tuple[int, dict]:
+        self._count("requests")
+        chance, jitter = self._draw()
+        time.sleep(max(0.0, self.latency + jitter))
+
+        if self._quota_exceeded() or chance < self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                   "message": f"Quota exceeded for model {model} (mock)",
+                                   "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                                "retryDelay": "1s"}]}}
+        if chance < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            return 500, {"error": {"code": 500, "status": "INTERNAL", "message": "Internal error (mock)"}}
+
+        contents = body.get("contents", [])
+        turn = sum(content.get("role", "user") == "user" for content in contents)
+        if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+            text = self._evaluation(turn)
+        else:
+            text = f"```python\n{self._suite(turn)}```"
+
+        prompt_tokens = len(json.dumps(contents)) // 4
+        response_tokens = len(text) // 4
+        self._count("responses")
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP",
+                            "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": response_tokens,
+                              "totalTokenCount": prompt_tokens + response_tokens},
+            "modelVersion": model,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockGeminiServer"
+
+    def _reply(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.server.mock.stats)
+        else:
+            self._reply(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": self.path}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        match = MODEL_PATH.match(self.path.split("?")[0])
+        if match and match["method"] == "generateContent":
+            self._reply(*self.server.mock.generate_content(match["model"], body))
+        elif match and match["method"] == "countTokens":
+            self._reply(200, {"totalTokens": len(json.dumps(body.get("contents", []))) // 4})
+        else:
+            self._reply(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": self.path}})
+
+    def log_message(self, format, *args):
+        LOGGER.debug("Mock server: " + format % args)
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, mock: MockGemini, host: str = "127.0.0.1", port: int = MOCK_SERVER_PORT):
+        super().__init__((host, port), _Handler)
+        self.mock = mock
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        # serve from a background thread, e.g. next to the pipeline in the same process
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini generateContent API "
+                                                 "(point the pipeline to it with GEMINI_BASE_URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MOCK_SERVER_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests rejected with 429")
+    parser.add_argument("--rpm", type=int, default=None, help="reject requests beyond this many per minute (429)")
+    parser.add_argument("--suite", action="append", default=[],
+                        help="canned test suite returned by the generator (repeat to cycle through several)")
+    parser.add_argument("--base-score", type=int, default=40, help="evaluator score of the first turn")
+    parser.add_argument("--score-step", type=int, default=10, help="evaluator score increase per turn")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    suites = []
+    for path in args.suite:
+        with open(path, "r") as f:
+            suites.append(f.read())
+
+    server = MockGeminiServer(MockGemini(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.rpm,
+                                         suites, args.base_score, args.score_step, args.seed), args.host, args.port)
+    LOGGER.info(f"Mock Gemini server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        LOGGER.info(f"Mock server stats: {server.mock.stats}")
+        server.server_close()
@@ -0,0 +1,157 @@
+import ast
+from dataclasses import asdict, dataclass, field
+
+from static_check import is_enum
+from utils import parse_source
+
+KILLED = "killed"  # a test that passes against the original sources failed
+TIMED_OUT = "timed out"  # counted as killed, e.g. an endless loop once `self._curr_column += 1` is removed
+SURVIVED = "survived"
+NOT_COVERED = "not covered"  # survived, no passing test executes the mutated line
+
+COMPARISONS = {ast.Eq: ast.NotEq, ast.NotEq: ast.Eq, ast.Lt: ast.LtE, ast.LtE: ast.Lt, ast.Gt: ast.GtE,
+               ast.GtE: ast.Gt, ast.In: ast.NotIn, ast.NotIn: ast.In, ast.Is: ast.IsNot, ast.IsNot: ast.Is}
+ARITHMETIC = {ast.Add: ast.Sub, ast.Sub: ast.Add, ast.Mult: ast.FloorDiv, ast.Div: ast.Mult, ast.FloorDiv: ast.Mult}
+BOOLEAN = {ast.And: ast.Or, ast.Or: ast.And}
+
+
+@dataclass
+class Mutant:
+    path: str  # relative to the project, e.g. src/lexer.py
+    line: int  # of the original source
+    description: str  # e.g. `char == "="` -> `char != "="`
+    module_level: bool  # runs while src is imported, every test may depend on it
+    source: str = field(repr=False)
+
+
+@dataclass
+class MutantResult:
+    path: str
+    line: int
+    description: str
+    status: str
+    killed_by: str | None = None  # first failing test
+
+    def __str__(self):
+        return f"{self.path}:{self.line} {self.description}"
+
+
+@dataclass
+class MutationReport:
+    mutants: list[MutantResult] = field(default_factory=list)
+    duration: float = 0.0
+
+    def killed(self) -> int:
+        return sum(mutant.status in (KILLED, TIMED_OUT) for mutant in self.mutants)
+
+    def score(self) -> float:
+        return 100 * self.killed() / len(self.mutants) if self.mutants else 100.0
+
+    def surviving(self) -> list[MutantResult]:
+        return [mutant for mutant in self.mutants if mutant.status in (SURVIVED, NOT_COVERED)]
+
+    def summary(self) -> str:
+        # no run time, the summary is part of the evaluator prompt and identical prompts hit the response cache
+        not_covered = sum(mutant.status == NOT_COVERED for mutant in self.mutants)
+        return (f"mutation score {self.score():.1f}% ({self.killed()} of {len(self.mutants)} mutants killed, "
+                f"{not_covered} never executed)")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls([MutantResult(**mutant) for mutant in data["mutants"]], data["duration"])
+
+
+def _excluded_lines(tree: ast.Module) -> set[int]:
+    # the `if __name__ == "__main__":` block never runs under the tests
+    lines = set()
+    for node in tree.body:
+        if isinstance(node, ast.If) and "__name__" in {name.id for name in ast.walk(node.test)
+                                                       if isinstance(name, ast.Name)}:
+            lines.update(range(node.lineno, node.end_lineno + 1))
+    return lines
+
+
+def _in_functions(tree: ast.Module) -> set[int]:
+    return {id(node) for function in ast.walk(tree) if isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef))
+            for node in ast.walk(function)}
+
+
+def _sites(tree: ast.Module):
+    # (index of the node in ast.walk order, how to mutate it) for every mutation of the tree
+    nodes = list(ast.walk(tree))
+    excluded = _excluded_lines(tree)
+    annotations = {id(node) for annotated in nodes for annotation in (getattr(annotated, "annotation", None),
+                                                                      getattr(annotated, "returns", None))
+                   if annotation is not None for node in ast.walk(annotation)}
+    for index, node in enumerate(nodes):
+        if getattr(node, "lineno", None) in excluded or id(node) in annotations:
+            continue
+        if isinstance(node, ast.Compare):
+            for position, op in enumerate(node.ops):
+                if type(op) in COMPARISONS:
+                    yield index, ("compare", position)
+        elif isinstance(node, ast.BoolOp):
+            yield index, ("boolean", None)
+        elif isinstance(node, (ast.BinOp, ast.AugAssign)) and type(node.op) in ARITHMETIC:
+            yield index, ("arithmetic", None)
+        elif isinstance(node, ast.Constant) and type(node.value) in (bool, int):
+            yield index, ("constant", None)
+
+        # statements removed: counters, appends and other calls for their side effect, enum members
+        for name in ("body", "orelse", "finalbody"):
+            body = getattr(node, name, None)
+            if not isinstance(body, list) or len(body) < 2 or isinstance(node, ast.Module):
+                continue
+            for position, statement in enumerate(body):
+                if statement.lineno in excluded:
+                    continue
+                if isinstance(statement, ast.AugAssign) or \
+                        (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)) or \
+                        (isinstance(node, ast.ClassDef) and is_enum(node) and isinstance(statement, ast.Assign)):
+                    yield index, ("remove", (name, position))
+
+
+def _mutate(node: ast.AST, kind: str, detail) -> tuple[int, str]:
+    # mutates the node in place, returns the line and description of the mutation
+    if kind == "remove":
+        name, position = detail
+        statement = getattr(node, name)[position]
+        getattr(node, name)[position] = ast.copy_location(ast.Pass(), statement)
+        return statement.lineno, f"removed `{ast.unparse(statement)}`"
+
+    before = ast.unparse(node)
+    if kind == "compare":
+        node.ops[detail] = COMPARISONS[type(node.ops[detail])]()
+    elif kind == "boolean":
+        node.op = BOOLEAN[type(node.op)]()
+    elif kind == "arithmetic":
+        node.op = ARITHMETIC[type(node.op)]()
+    elif kind == "constant":
+        node.value = not node.value if isinstance(node.value, bool) else node.value + 1
+    return node.lineno, f"`{before}` -> `{ast.unparse(node)}`"
+
+
+def generate_mutants(path: str, source: str) -> list[Mutant]:
+    try:
+        tree = parse_source(source)
+    except SyntaxError:
+        return []
+    original = ast.unparse(tree)
+    mutants, seen = [], {original}
+    for index, (kind, detail) in _sites(tree):
+        # every mutant starts from a fresh tree, the sites are found again by their ast.walk index
+        mutated = parse_source(source)
+        nodes = list(ast.walk(mutated))
+        module_level = id(nodes[index]) not in _in_functions(mutated)
+        line, description = _mutate(nodes[index], kind, detail)
+        if kind == "constant":
+            description += f" in `{source.splitlines()[line - 1].strip()}`"
+        mutated_source = ast.unparse(mutated)
+        if mutated_source in seen:  # e.g. a constant folded into the same code
+            continue
+        seen.add(mutated_source)
+        mutants.append(Mutant(path, line, description, module_level, mutated_source))
+    return sorted(mutants, key=lambda mutant: mutant.line)
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import importlib.abc
+import importlib.util
+import json
+import logging
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+
+from constants import LOGGER_NAME, MUTANT_TIMEOUT_FACTOR, MUTANT_MIN_TIMEOUT, MUTATION_CACHE_DIR, MUTATION_CACHE_SIZE
+from executors import ExecutionError, ForkServerExecutor, run_tests
+from mutants import Mutant, MutantResult, MutationReport, generate_mutants, KILLED, TIMED_OUT, SURVIVED, NOT_COVERED
+from results import ExecutionResult, PASSED
+from sandbox import Sandbox
+from supervisor import ExecutionLimits, crash_message, timeout_message
+from utils import read_project_sources, sources_hash
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+class _MutantLoader(importlib.abc.Loader):
+    def __init__(self, filename: str, source: str):
+        self.filename = filename
+        self.source = source
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        exec(compile(self.source, self.filename, "exec"), module.__dict__)
+
+
+class _MutantFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, name: str, filename: str, source: str):
+        self.name = name
+        self.filename = filename
+        self.source = source
+
+    def find_spec(self, name, path=None, target=None):
+        if name != self.name:
+            return None
+        package = os.path.basename(self.filename) == "__init__.py"
+        spec = importlib.util.spec_from_loader(name, _MutantLoader(self.filename, self.source), origin=self.filename,
+                                               is_package=package)
+        if package:
+            spec.submodule_search_locations = [os.path.dirname(self.filename)]
+        return spec
+
+
+def run_mutant(run_dir: str, path: str | None, source: str | None, test_ids: list[str],
+               limits: ExecutionLimits | None = None) -> ExecutionResult:
+    # in a process of its own: src is imported again, with the mutant in place of the module at path (the unmutated
+    # sources without a path)
+    for name in [name for name in sys.modules if name == "src" or name.startswith("src.")]:
+        del sys.modules[name]
+    if path is not None:
+        name = path.removesuffix(".py").removesuffix("/__init__").replace("/", ".")
+        sys.meta_path.insert(0, _MutantFinder(name, os.path.join(run_dir, path), source))
+    # the first failing test kills the mutant
+    return run_tests(run_dir, test_ids, limits=limits, failfast=path is not None)
+
+
+class MutationTester:
+    # runs every mutant of src against the passing tests that execute the mutated line (all passing tests for
+    # module-level code), in parallel processes forked from a fork server or in fresh subprocesses without os.fork
+    def __init__(self, project_dir: str, workers: int | None = None, limits: ExecutionLimits | None = None,
+                 targets: list[str] | None = None, cache_dir: str | None = MUTATION_CACHE_DIR):
+        self.project_dir = project_dir
+        self.workers = workers or os.cpu_count() or 1
+        # a mutant has its own time limit, derived from the run time of its tests; the unmutated baseline run has the
+        # time limit of an execution
+        self.baseline_timeout = (limits or ExecutionLimits()).timeout
+        self.limits = replace(limits or ExecutionLimits(), timeout=None, test_timeout=None)
+        self.targets = targets  # e.g. ["src/lexer.py"], every python file of src if not given
+        self.cache_dir = cache_dir
+        self.server = ForkServerExecutor(project_dir, self.limits) if hasattr(os, "fork") else None
+
+    def _mutants(self, run_dir: str) -> list[Mutant]:
+        sources = {f"src/{path}": content for path, content in read_project_sources(run_dir).items()}
+        targets = self.targets if self.targets is not None else list(sources)
+        return [mutant for path in targets if path in sources for mutant in generate_mutants(path, sources[path])]
+
+    def _run_subprocess(self, run_dir: str, path: str | None, source: str | None, test_ids: list[str],
+                        limits: ExecutionLimits, timeout: float | None) -> ExecutionResult:
+        job = {"path": path, "source": source, "test_ids": test_ids, "limits": asdict(limits)}
+        try:
+            execution = subprocess.run([sys.executable, "-B", os.path.abspath(__file__), os.path.abspath(run_dir)],
+                                       input=json.dumps(job), capture_output=True, text=True, cwd=run_dir,
+                                       timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise ExecutionError(timeout_message(timeout))
+        try:
+            return ExecutionResult.from_dict(json.loads(execution.stdout))
+        except (ValueError, KeyError, TypeError):
+            raise ExecutionError(crash_message(execution.returncode) + execution.stderr)
+
+    def _call(self, run_dir: str, path: str | None, source: str | None, test_ids: list[str],
+              timeout: float | None, cpu_seconds: int | None = None) -> ExecutionResult:
+        # every run gets its own sandbox of the project with the suite of run_dir, tests write their input files to the
+        # cwd (the files the execution left in run_dir would be read-only in a sandbox of it)
+        with open(os.path.join(run_dir, "tests.py"), "r") as f:
+            tests = f.read()
+        limits = replace(self.limits, cpu_seconds=cpu_seconds) if cpu_seconds else self.limits
+        with Sandbox(self.project_dir, tests) as mutant_dir:
+            if self.server:
+                return self.server.call(run_mutant, mutant_dir, path, source, test_ids, limits, timeout=timeout)
+            return self._run_subprocess(mutant_dir, path, source, test_ids, limits, timeout)
+
+    def _baseline(self, run_dir: str, execution: ExecutionResult) -> tuple[dict[str, float], float]:
+        # the passing tests once more against the unmutated sources in the harness of the mutants: run time of every
+        # test that passes there too and the cost of the harness (forking, importing src, loading tests.py)
+        test_ids = [test.test for test in execution.tests if test.outcome == PASSED]
+        start = time.perf_counter()
+        try:
+            baseline = self._call(run_dir, None, None, test_ids, self.baseline_timeout)
+        except ExecutionError as e:
+            LOGGER.warning(f"Unmutated baseline run of the mutation tests failed, using the run times of the "
+                           f"execution: {e}")
+            return {test.test: test.duration for test in execution.tests if test.outcome == PASSED}, 0.0
+        elapsed = time.perf_counter() - start
+        durations = {test.test: test.duration for test in baseline.tests if test.outcome == PASSED}
+        return durations, max(elapsed - sum(test.duration for test in baseline.tests), 0.0)
+
+    def _test_mutant(self, run_dir: str, mutant: Mutant, execution: ExecutionResult, durations: dict[str, float],
+                     overhead: float) -> MutantResult:
+        result = MutantResult(mutant.path, mutant.line, mutant.description, NOT_COVERED)
+        # tests failing in the baseline would kill every mutant
+        tests = [test for test in execution.tests if test.test in durations
+                 and (mutant.module_level or mutant.line in test.lines.get(mutant.path, ()))]
+        if not tests:
+            return result
+
+        test_ids = [test.test for test in tests]
+        # a limit of CPU time is not stretched by the mutants running in parallel, the baseline ran alone so its run
+        # times are CPU times; the wall-clock limit only stops mutants that hang without using the CPU, every one of
+        # the parallel mutants gets at least its share of the CPU
+        expected = overhead + sum(durations[test_id] for test_id in test_ids)
+        cpu_seconds = max(1, math.ceil(MUTANT_TIMEOUT_FACTOR * expected))
+        timeout = cpu_seconds * self.workers + MUTANT_MIN_TIMEOUT
+        try:
+            mutated = self._call(run_dir, mutant.path, mutant.source, test_ids, timeout, cpu_seconds)
+        except ExecutionError as e:
+            timed_out = str(e) == timeout_message(timeout) or str(e).startswith(crash_message(-signal.SIGXCPU))
+            result.status = TIMED_OUT if timed_out else KILLED
+            return result
+
+        failed = [test.test for test in mutated.tests if test.outcome != PASSED]
+        if failed or mutated.error or len(mutated.tests) < len(test_ids):
+            result.status, result.killed_by = KILLED, failed[0] if failed else None
+        else:
+            result.status = SURVIVED
+        return result
+
+    def _key(self, run_dir: str) -> str:
+        with open(os.path.join(run_dir, "tests.py"), "r") as f:
+            tests = f.read()
+        payload = json.dumps({"tests": tests, "sources": sources_hash(run_dir), "targets": self.targets})
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _cached(self, key: str) -> MutationReport | None:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.json"), "r") as f:
+                return MutationReport.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _store(self, key: str, report: MutationReport):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        with open(f"{path}.{threading.get_ident()}.tmp", "w") as f:
+            json.dump(report.to_dict(), f)
+        os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+        # the oldest reports are removed beyond the size limit
+        reports = sorted((entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in reports[:max(0, len(reports) - MUTATION_CACHE_SIZE)]:
+            os.remove(entry.path)
+
+    def run(self, run_dir: str, execution: ExecutionResult) -> MutationReport:
+        key = self._key(run_dir)
+        report = self._cached(key)
+        if report is not None:
+            LOGGER.info(f"Mutation testing of src/ reused for the unchanged test suite! {report.summary()}")
+            return report
+
+        start = time.perf_counter()
+        mutants = self._mutants(run_dir)
+        durations, overhead = self._baseline(run_dir, execution)
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = list(pool.map(lambda mutant: self._test_mutant(run_dir, mutant, execution, durations, overhead),
+                                    mutants))
+        report = MutationReport(results, time.perf_counter() - start)
+        self._store(key, report)
+
+        LOGGER.info(f"Mutation testing of src/ done in {report.duration:.1f}s! {report.summary()}")
+        for mutant in report.surviving():
+            LOGGER.debug(f"Surviving mutant ({mutant.status}) {mutant}")
+        return report
+
+    async def run_async(self, run_dir: str, execution: ExecutionResult) -> MutationReport:
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, run_dir, execution)
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+
+if __name__ == "__main__":
+    # used by MutationTester without os.fork: runs the tests of the given directory against the mutant on stdin
+    run_dir, job = sys.argv[1], json.load(sys.stdin)
+    sys.path.insert(0, run_dir)
+    print(json.dumps(run_mutant(run_dir, job["path"], job["source"], job["test_ids"],
+                                ExecutionLimits(**job["limits"])).to_dict()))
@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from enum import IntEnum
+from typing import NamedTuple
+
+from google.genai import errors, types
+
+from constants import LOGGER_NAME
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+CHARS_PER_TOKEN = 4
+POLL_INTERVAL = 0.05  # seconds a queued caller sleeps while another caller is served first
+RETRY_STATUS_CODES = (429, 500, 503)
+
+
+class Priority(IntEnum):
+    # lower value is served first
+    EVALUATOR = 0
+    GENERATOR = 1
+
+
+class ModelLimit(NamedTuple):
+    requests_per_min: int
+    tokens_per_min: int
+    request_burst: int = 1  # requests that may be sent back-to-back (more risks exceeding the per min quota)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.refill_per_sec)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.refill(now)
+        amount = min(amount, self.capacity)  # oversized requests only wait for a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_per_sec
+
+    def consume(self, amount: float, now: float):
+        # the level may drop below zero (reconciled token usage, server side back-off)
+        self.refill(now)
+        self.level -= amount
+
+
+class _ModelState:
+    def __init__(self, limit: ModelLimit):
+        self.requests = TokenBucket(limit.request_burst, limit.requests_per_min / 60)
+        self.tokens = TokenBucket(limit.tokens_per_min, limit.tokens_per_min / 60)
+        self.queue: list[tuple[int, int]] = []
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[int, ...]], default_limit: tuple[int, ...] | None = None):
+        self._limits = {model: ModelLimit(*limit) for model, limit in limits.items()}
+        self._default_limit = ModelLimit(*default_limit) if default_limit else None
+        self._models: dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+
+    def _state(self, model: str) -> _ModelState | None:
+        if model not in self._models:
+            limit = self._limits.get(model, self._default_limit)
+            if limit is None:
+                return None
+            self._models[model] = _ModelState(limit)
+        return self._models[model]
+
+    def _enqueue(self, model: str, priority: Priority) -> tuple[int, int] | None:
+        with self._lock:
+            state = self._state(model)
+            if state is None:
+                return None
+            ticket = (int(priority), next(self._tickets))
+            heapq.heappush(state.queue, ticket)
+            return ticket
+
+    def _dequeue(self, model: str, ticket: tuple[int, int]):
+        with self._lock:
+            queue = self._models[model].queue
+            if ticket in queue:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+
+    def _poll(self, model: str, ticket: tuple[int, int], tokens: int) -> float:
+        with self._lock:
+            state = self._models[model]
+            if state.queue[0] != ticket:
+                return POLL_INTERVAL
+
+            now = time.monotonic()
+            wait = max(state.requests.wait_time(1, now), state.tokens.wait_time(tokens, now))
+            if wait == 0:
+                state.requests.consume(1, now)
+                state.tokens.consume(tokens, now)
+                heapq.heappop(state.queue)
+            return wait
+
+    def acquire(self, model: str, tokens: int, priority: Priority = Priority.GENERATOR):
+        ticket = self._enqueue(model, priority)
+        if ticket is None:
+            return
+
+        start = time.monotonic()
+        try:
+            while (wait := self._poll(model, ticket, tokens)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+        self._log_wait(model, priority, time.monotonic() - start)
+
+    async def acquire_async(self, model: str, tokens: int, priority: Priority = Priority.GENERATOR):
+        ticket = self._enqueue(model, priority)
+        if ticket is None:
+            return
+
+        start = time.monotonic()
+        try:
+            while (wait := self._poll(model, ticket, tokens)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+        self._log_wait(model, priority, time.monotonic() - start)
+
+    @staticmethod
+    def _log_wait(model: str, priority: Priority, waited: float):
+        if waited >= 0.5:
+            LOGGER.debug(f"Rate limiter held {priority.name.lower()} request to {model} for {waited:.1f}s")
+
+    def settle(self, model: str, estimated_tokens: int, used_tokens: int | None):
+        # correct the token budget once the real usage of a request is known
+        if used_tokens is None:
+            return
+        with self._lock:
+            state = self._state(model)
+            if state is not None:
+                state.tokens.consume(used_tokens - estimated_tokens, time.monotonic())
+
+    def backoff(self, model: str, seconds: float):
+        # the server rejected a request: hold back every caller of the model for the given time
+        with self._lock:
+            state = self._state(model)
+            if state is not None:
+                now = time.monotonic()
+                state.requests.refill(now)
+                state.requests.level = min(state.requests.level, 1 - seconds * state.requests.refill_per_sec)
+
+
+def estimate_tokens(contents: list[types.Content], config: types.GenerateContentConfig | None = None) -> int:
+    chars = sum(len(part.text or "") for content in contents for part in content.parts or [])
+    if config is not None and isinstance(config.system_instruction, str):
+        chars += len(config.system_instruction)
+    return chars // CHARS_PER_TOKEN + 1
+
+
+def retry_delay(error: errors.APIError, attempt: int) -> float | None:
+    if error.code not in RETRY_STATUS_CODES:
+        return None
+
+    # prefer the delay requested by the server (google.rpc.RetryInfo)
+    details = error.details.get("error", {}).get("details", []) if isinstance(error.details, dict) else []
+    for detail in details:
+        if detail.get("@type", "").endswith("RetryInfo") and "retryDelay" in detail:
+            return float(detail["retryDelay"].rstrip("s"))
+
+    headers = getattr(error.response, "headers", None) or {}
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    return min(2 ** attempt, 60)
@@ -0,0 +1,104 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict
+
+from constants import LOGGER_NAME, TEST_RESULT_CACHE_DIR, TEST_RESULT_CACHE_SIZE
+from results import TestOutcome, is_complete
+from utils import parse_source, project_key
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+
+def _is_test(node: ast.AST) -> bool:
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test")
+
+
+def _class_context(node: ast.ClassDef, classes: dict[str, ast.ClassDef], seen: set[str]) -> list[str]:
+    # everything of a class but its test methods (fixtures, helpers, attributes), including its bases in tests.py
+    seen.add(node.name)
+    context = [ast.dump(base) for base in node.bases + node.keywords + node.decorator_list]
+    context += [ast.dump(member) for member in node.body if not _is_test(member)]
+    for base in node.bases:
+        if isinstance(base, ast.Name) and base.id in classes and base.id not in seen:
+            context += _class_context(classes[base.id], classes, seen)
+    return context
+
+
+def test_keys(tests_str: str, src_hash: str) -> dict[str, str]:
+    # cache key of every test method in tests.py: its normalized AST, the fixtures and helpers of its class, the
+    # module level code it may depend on and the sources under test
+    try:
+        tree = parse_source(tests_str)
+    except SyntaxError:
+        return {}
+
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    test_classes = {name for name, node in classes.items() if any(_is_test(member) for member in node.body)}
+    module_context = [ast.dump(node) for node in tree.body
+                      if not isinstance(node, ast.ClassDef) or node.name not in test_classes]
+
+    keys = {}
+    for name in test_classes:
+        context = module_context + _class_context(classes[name], classes, set())
+        for member in classes[name].body:
+            if _is_test(member):
+                data = json.dumps([src_hash, context, ast.dump(member)])
+                keys[f"tests.{name}.{member.name}"] = hashlib.sha256(data.encode()).hexdigest()
+    return keys
+
+
+class TestResultCache:
+    # outcomes of single test methods by their test_keys, least recently used entries are evicted
+    def __init__(self, path: str, max_entries: int = TEST_RESULT_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = self._lookups = 0
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @classmethod
+    def for_project(cls, project_dir: str):
+        return cls(os.path.join(TEST_RESULT_CACHE_DIR, f"{project_key(project_dir)}.json"))
+
+    def get_all(self, keys: dict[str, str]) -> dict[str, TestOutcome]:
+        with self._lock:
+            outcomes = {}
+            for test_id, key in keys.items():
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.entries[key] = entry
+                    if is_complete(entry):
+                        outcomes[test_id] = TestOutcome(**entry)
+            self._hits += len(outcomes)
+            self._lookups += len(keys)
+            return outcomes
+
+    def put_all(self, keys: dict[str, str], outcomes: list[TestOutcome]):
+        with self._lock:
+            for outcome in outcomes:
+                if outcome.test in keys:
+                    self.entries.pop(keys[outcome.test], None)
+                    self.entries[keys[outcome.test]] = asdict(outcome)
+            for key in list(self.entries)[:max(0, len(self.entries) - self.max_entries)]:
+                del self.entries[key]
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", "w") as f:
+                json.dump(self.entries, f)
+            os.replace(f"{self.path}.tmp", self.path)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self._hits, "lookups": self._lookups, "entries": len(self.entries)}
+
+    def log_stats(self):
+        rate = 100 * self._hits / self._lookups if self._lookups else 0.0
+        LOGGER.info(f"Test result cache: {self._hits} of {self._lookups} test runs reused ({rate:.0f}% hit rate), "
+                    f"{len(self.entries)} entries")
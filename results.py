@@ -0,0 +1,263 @@
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import unittest
+from dataclasses import asdict, dataclass, field, fields
+
+from branch_coverage import CoverageReport, measure_coverage
+from mutants import MutationReport
+from token_coverage import TokenMatrix, TokenRecorder, token_matrix
+from tracing import CoverageTracer
+
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+SKIPPED = "skipped"
+EXPECTED_FAILURE = "expected failure"
+UNEXPECTED_SUCCESS = "unexpected success"
+
+
+@dataclass
+class TestOutcome:
+    test: str  # test id, e.g. tests.LexerTest.test_newline_handling
+    outcome: str = PASSED
+    duration: float = 0.0
+    exception: str | None = None  # exception type, the reason of a skip is stored as message
+    message: str | None = None
+    frame: str | None = None  # innermost project frame, e.g. src/lexer.py:72 in __init__
+    source: str | None = None  # source line of that frame
+    output: str = ""  # written to stdout/stderr while the test ran
+    traceback: str | None = None  # project frames only
+    lines: dict[str, list[int]] = field(default_factory=dict)  # executed lines of src, e.g. {"src/lexer.py": [12, 13]}
+    arcs: dict[str, list[list[int]]] = field(default_factory=dict)  # executed pairs of consecutive lines of src
+    tokens: list[str] = field(default_factory=list)  # token variants lexed, e.g. ["Keyword.CLASS", "edge:comment"]
+
+
+OUTCOME_FIELDS = {f.name for f in fields(TestOutcome)}
+
+
+@dataclass
+class ExecutionResult:
+    tests: list[TestOutcome] = field(default_factory=list)
+    duration: float = 0.0
+    output: str = ""  # written outside of the tests, e.g. while importing tests.py
+    error: str | None = None  # tests.py could not be imported or the test process crashed
+    coverage: CoverageReport | None = None  # of src by all tests
+    mutation: MutationReport | None = None  # of src, killed by the tests that passed
+    tokens: TokenMatrix | None = None  # token variants exercised by all tests
+
+    @classmethod
+    def merge(cls, results: list["ExecutionResult"], duration: float):
+        errors = [result.error for result in results if result.error]
+        return cls([test for result in results for test in result.tests], duration,
+                   "".join(result.output for result in results), "\n".join(errors) if errors else None)
+
+    def counts(self) -> dict[str, int]:
+        outcomes = [test.outcome for test in self.tests]
+        return {"ran": len(outcomes),
+                "passed": sum(outcome in (PASSED, EXPECTED_FAILURE) for outcome in outcomes),
+                "failures": sum(outcome in (FAILED, UNEXPECTED_SUCCESS) for outcome in outcomes),
+                "errors": outcomes.count(ERROR) + (self.error is not None),
+                "skipped": outcomes.count(SKIPPED)}
+
+    def local_score(self) -> tuple[float, int]:
+        # pass rate of the executed tests, more tests win ties
+        counts = self.counts()
+        if counts["ran"] == 0:
+            return 0.0, 0
+        return 100 * counts["passed"] / counts["ran"], counts["ran"]
+
+    def measure_coverage(self, sources: dict[str, str]):
+        # coverage of all tests, whichever process or cache they came from
+        lines, arcs = {}, {}
+        for test in self.tests:
+            for path, covered in test.lines.items():
+                lines.setdefault(path, set()).update(covered)
+            for path, covered in test.arcs.items():
+                arcs.setdefault(path, set()).update(map(tuple, covered))
+        self.coverage = measure_coverage(sources, lines, arcs)
+
+    def measure_tokens(self, source: str | None):
+        # source of the tokens module, no matrix without one
+        exercised = {variant for test in self.tests for variant in test.tokens}
+        self.tokens = token_matrix(source, exercised) if source is not None else None
+
+    def problems(self) -> list[TestOutcome]:
+        return [test for test in self.tests if test.outcome in (FAILED, ERROR, UNEXPECTED_SUCCESS)]
+
+    def summary(self) -> str:
+        counts = self.counts()
+        summary = (f"{counts['ran']} tests ran in {self.duration:.3f}s: {counts['passed']} passed, "
+                   f"{counts['failures']} failed, {counts['errors']} errors, {counts['skipped']} skipped")
+        return summary + (" (the test suite could not be run completely)" if self.error else "")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        data = dict(data)
+        data["tests"] = [TestOutcome(**test) for test in data["tests"]]
+        data["coverage"] = CoverageReport.from_dict(data["coverage"]) if data.get("coverage") else None
+        data["mutation"] = MutationReport.from_dict(data["mutation"]) if data.get("mutation") else None
+        data["tokens"] = TokenMatrix.from_dict(data["tokens"]) if data.get("tokens") else None
+        return cls(**data)
+
+
+def is_complete(entry: dict) -> bool:
+    # cached outcomes recorded before a field was added to TestOutcome lack what it measures, their tests run again
+    return all(name in entry for name in OUTCOME_FIELDS)
+
+
+class TestTimeout(BaseException):
+    # not an Exception, so tests catching exceptions can not swallow it
+    pass
+
+
+def short_id(test_id: str) -> str:
+    # all tests live in tests.py
+    return test_id.removeprefix("tests.")
+
+
+def project_roots(run_dir: str) -> list[str]:
+    # the run directory and the directory src is imported from (the project itself for pre-loaded executors)
+    roots = [os.path.abspath(run_dir)]
+    src = sys.modules.get("src")
+    for path in getattr(src, "__path__", []):
+        root = os.path.dirname(os.path.abspath(path))
+        if root not in roots:
+            roots.append(root)
+    return roots
+
+
+def _project_path(filename: str, roots: list[str]) -> str | None:
+    path = os.path.abspath(filename)
+    for root in roots:
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root).replace(os.sep, "/")
+    return None
+
+
+def format_exception(err: BaseException, roots: list[str]) -> str:
+    # project frames only, with paths relative to the project so tracebacks of sandboxed runs look alike
+    frames = [traceback.FrameSummary(_project_path(frame.filename, roots), frame.lineno, frame.name, line=frame.line)
+              for frame in traceback.extract_tb(err.__traceback__) if _project_path(frame.filename, roots)]
+    lines = traceback.format_list(frames)
+    return "".join(["Traceback (most recent call last):\n"] + lines + traceback.format_exception_only(type(err), err))
+
+
+class ResultCollector(unittest.TestResult):
+    # records an outcome for every test, the output of a test is captured on its own; started and finished tests are
+    # appended to the journal file, so they are known even if the test process is killed
+    def __init__(self, run_dir: str, journal: str | None = None, test_timeout: float | None = None):
+        super().__init__()
+        self.run_dir = run_dir
+        self.journal = journal
+        self.test_timeout = test_timeout
+        self.outcomes: list[TestOutcome] = []
+        self._current = None
+        self._started = 0.0
+        self._streams = None
+        self._tracer = None
+        self._recorder = None
+        self._timer = False
+
+    def _write_journal(self, entry: dict):
+        if self.journal:
+            with open(self.journal, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _timed_out(self, signum, frame):
+        raise TestTimeout(f"The test did not finish within its time limit of {self.test_timeout}s")
+
+    def _start_timer(self):
+        # SIGALRM interrupts the test, signal handlers can only be set in the main thread
+        self._timer = bool(self.test_timeout) and hasattr(signal, "setitimer") \
+            and threading.current_thread() is threading.main_thread()
+        if self._timer:
+            signal.signal(signal.SIGALRM, self._timed_out)
+            signal.setitimer(signal.ITIMER_REAL, self.test_timeout)
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._write_journal({"started": test.id()})
+        self._current = TestOutcome(test.id())
+        self._streams = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = io.StringIO()
+        self._tracer = CoverageTracer([os.path.join(root, "src") for root in project_roots(self.run_dir)])
+        self._recorder = TokenRecorder()
+        self._recorder.start()
+        self._started = time.perf_counter()
+        self._start_timer()
+        self._tracer.start()
+
+    def stopTest(self, test):
+        tracer = self._tracer.stop()
+        recorder = self._recorder.stop()
+        if self._timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        self._current.duration = time.perf_counter() - self._started
+        self._current.output = sys.stdout.getvalue()
+        sys.stdout, sys.stderr = self._streams
+        if self._current.exception != TestTimeout.__name__:  # coverage of an interrupted test is incomplete
+            roots = project_roots(self.run_dir)
+            self._current.lines = {_project_path(filename, roots): sorted(numbers)
+                                   for filename, numbers in tracer.lines.items()}
+            self._current.arcs = {_project_path(filename, roots): sorted(map(list, arcs))
+                                  for filename, arcs in tracer.arcs.items()}
+            self._current.tokens = sorted(recorder.variants)
+        self.outcomes.append(self._current)
+        self._write_journal(asdict(self._current))
+        self._current = None
+        super().stopTest(test)
+
+    def _record(self, test, outcome: str, err=None, message: str | None = None):
+        if self._current is not None and self._current.test == test.id():
+            record = self._current
+        else:
+            # errors outside of a running test, e.g. in setUpClass
+            record = TestOutcome(test.id())
+            self.outcomes.append(record)
+        if record.outcome not in (PASSED, SKIPPED):
+            return  # keep the first problem of a test
+
+        record.outcome, record.message = outcome, message
+        if err is not None:
+            exc_type, value, tb = err
+            roots = project_roots(self.run_dir)
+            record.exception, record.message = exc_type.__name__, str(value)
+            frames = [frame for frame in traceback.extract_tb(tb) if _project_path(frame.filename, roots)]
+            if frames:
+                record.frame = f"{_project_path(frames[-1].filename, roots)}:{frames[-1].lineno} in {frames[-1].name}"
+                record.source = frames[-1].line
+            record.traceback = format_exception(value.with_traceback(tb), roots)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, ERROR, err)
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, FAILED, err)
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None:
+            self._record(test, FAILED if issubclass(err[0], test.failureException) else ERROR, err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, SKIPPED, message=reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, EXPECTED_FAILURE)
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, UNEXPECTED_SUCCESS)
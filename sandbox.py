@@ -0,0 +1,117 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+# read-only copies of the project (all but its tests.py) by the hash of their files: [directory, number of sandboxes
+# using it]
+_snapshots: dict[str, list] = {}
+_snapshots_lock = threading.Lock()
+
+
+def _ignored(directory: str, names: list[str], top: str) -> set[str]:
+    # the suite of a sandbox is its own, hidden entries (.git, .cache) and byte code are no part of the project
+    return {name for name in names if name.startswith(".") or name == "__pycache__"
+            or (name == "tests.py" and directory == top)}
+
+
+def _tree_hash(directory: str) -> str:
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory, followlinks=True):
+        dirs[:] = sorted(set(dirs) - _ignored(root, dirs, directory))
+        for file in sorted(set(files) - _ignored(root, files, directory)):
+            path = os.path.join(root, file)
+            digest.update(f"{os.path.relpath(path, directory)}\0".encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _set_read_only(directory: str, read_only: bool):
+    for root, dirs, files in os.walk(directory):
+        os.chmod(root, 0o555 if read_only else 0o755)
+        for file in files:
+            os.chmod(os.path.join(root, file), 0o444 if read_only else 0o644)
+
+
+def _acquire_snapshot(project_dir: str) -> tuple[str, str]:
+    key = _tree_hash(project_dir)
+    with _snapshots_lock:
+        if key not in _snapshots:
+            snapshot = os.path.join(tempfile.mkdtemp(prefix="testsuitegen_project_"), "project")
+            shutil.copytree(project_dir, snapshot, ignore=lambda directory, names: _ignored(directory, names,
+                                                                                            project_dir))
+            _set_read_only(snapshot, True)
+            _snapshots[key] = [snapshot, 0]
+        _snapshots[key][1] += 1
+        return key, _snapshots[key][0]
+
+
+def _release_snapshot(key: str):
+    with _snapshots_lock:
+        _snapshots[key][1] -= 1
+        if _snapshots[key][1] == 0:
+            snapshot, _ = _snapshots.pop(key)
+            _set_read_only(snapshot, False)
+            shutil.rmtree(os.path.dirname(snapshot), ignore_errors=True)
+
+
+def _link(source: str, target: str, directory: bool = False):
+    try:
+        os.symlink(source, target, target_is_directory=directory)
+    except OSError:
+        # no symlinks without privileges on windows
+        if directory:
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+
+
+def _mirror(snapshot_dir: str, run_dir: str):
+    # directories of their own with the files of the snapshot linked into them: whatever the tests write next to the
+    # data files of the project is private to the sandbox, the data files themselves are read-only
+    for root, dirs, files in os.walk(snapshot_dir):
+        target = os.path.join(run_dir, os.path.relpath(root, snapshot_dir))
+        os.makedirs(target, exist_ok=True)
+        for file in files:
+            _link(os.path.join(root, file), os.path.join(target, file))
+
+
+class Sandbox:
+    # a temporary run directory per execution with its own tests.py and the rest of the project linked to a read-only
+    # copy, shared by all sandboxes of the same project files; src is linked as a whole, the other directories are
+    # recreated with their files linked, so whatever the tests write is private to the sandbox and removed with it
+    def __init__(self, project_dir: str, tests: str | None = None):
+        self.project_dir = project_dir
+        self.tests = tests  # the tests.py of the project if None
+        self._tmp_dir = None
+        self._snapshot = None
+
+    def __enter__(self) -> str:
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="testsuitegen_")
+        tests = self.tests
+        if tests is None and os.path.isfile(os.path.join(self.project_dir, "tests.py")):
+            with open(os.path.join(self.project_dir, "tests.py"), "r") as f:
+                tests = f.read()
+        if tests is not None:
+            with open(os.path.join(self._tmp_dir.name, "tests.py"), "w") as tests_file:
+                tests_file.write(tests)
+
+        self._snapshot, snapshot = _acquire_snapshot(self.project_dir)
+        for entry in os.scandir(snapshot):
+            target = os.path.join(self._tmp_dir.name, entry.name)
+            if entry.name == "src" or not entry.is_dir():
+                _link(entry.path, target, entry.is_dir())
+            else:
+                _mirror(entry.path, target)
+
+        return self._tmp_dir.name
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tmp_dir.cleanup()
+        self._tmp_dir = None
+        if self._snapshot is not None:
+            _release_snapshot(self._snapshot)
+            self._snapshot = None
@@ -0,0 +1,201 @@
+import glob
+import json
+import logging
+import math
+import os
+import re
+import threading
+from datetime import datetime
+
+from constants import LOGGER_NAME, SCORE_THRESHOLD, SCORE_HISTORY, PREDICTOR_MIN_SAMPLES, PREDICTOR_MAX_INTERVAL, \
+    PREDICTOR_CONFIDENCE_Z, PREDICTOR_RIDGE
+from decision import local_feedback
+from results import ExecutionResult
+
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+FEATURES = ["tests", "pass_rate", "failure_rate", "error_rate", "suite_error", "exceptions", "coverage_measured",
+            "line_coverage", "branch_coverage", "mutation_measured", "mutation_score"]
+
+LOG_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+) - \w+ - (\[[^\]]+\] )?(.*)$")
+SUMMARY = re.compile(r"(\d+) tests ran in [\d.]+s: (\d+) passed, (\d+) failed, (\d+) errors, (\d+) skipped")
+UNITTEST_RAN = re.compile(r"^Ran (\d+) tests? in", re.MULTILINE)
+UNITTEST_FAILED = re.compile(r"^FAILED \(([^)]*)\)", re.MULTILINE)
+EXCEPTION = re.compile(r"^(\w+(?:Error|Exception|Exit))\b", re.MULTILINE)
+COVERAGE = re.compile(r"line coverage ([\d.]+)% \(\d+/\d+\), branch coverage ([\d.]+)%")
+MUTATION = re.compile(r"mutation score ([\d.]+)%")
+
+
+def _rate(count: int, total: int) -> float:
+    return count / total if total else 0.0
+
+
+def execution_features(execution: ExecutionResult) -> dict[str, float]:
+    counts = execution.counts()
+    ran = counts["ran"]
+    features = {"tests": ran, "pass_rate": _rate(counts["passed"], ran), "failure_rate": _rate(counts["failures"], ran),
+                "error_rate": _rate(counts["errors"], ran), "suite_error": float(execution.error is not None),
+                "exceptions": len({test.exception for test in execution.problems() if test.exception})}
+    if execution.coverage is not None:
+        totals = execution.coverage.totals()
+        features.update(coverage_measured=1.0, line_coverage=_rate(totals["covered_lines"], totals["lines"]),
+                        branch_coverage=_rate(totals["covered_branches"], totals["branches"]))
+    if execution.mutation is not None:
+        features.update(mutation_measured=1.0, mutation_score=execution.mutation.score() / 100)
+    return features
+
+
+def _logged_features(text: str) -> dict[str, float] | None:
+    # features of an execution logged between "Execution of the generated test suite done!" and its score, either as
+    # the summary of an ExecutionResult or as the output of `python -m unittest` (archived runs)
+    summary = SUMMARY.search(text)
+    if summary:
+        ran, passed, failures, errors, skipped = map(int, summary.groups())
+    elif UNITTEST_RAN.search(text):
+        ran = int(UNITTEST_RAN.search(text).group(1))
+        failed = UNITTEST_FAILED.search(text)
+        outcomes = dict(item.split("=") for item in failed.group(1).split(", ")) if failed else {}
+        failures, errors = int(outcomes.get("failures", 0)), int(outcomes.get("errors", 0))
+        passed = ran - failures - errors - int(outcomes.get("skipped", 0))
+    else:
+        return None
+
+    suite_error = "Failed to import test module" in text or "could not be run completely" in text
+    features = {"tests": ran, "pass_rate": _rate(passed, ran), "failure_rate": _rate(failures, ran),
+                "error_rate": _rate(errors, ran), "suite_error": float(suite_error),
+                "exceptions": len(set(EXCEPTION.findall(text)))}
+    coverage = COVERAGE.search(text)
+    if coverage:
+        features.update(coverage_measured=1.0, line_coverage=float(coverage.group(1)) / 100,
+                        branch_coverage=float(coverage.group(2)) / 100)
+    mutation = MUTATION.search(text)
+    if mutation:
+        features.update(mutation_measured=1.0, mutation_score=float(mutation.group(1)) / 100)
+    return features
+
+
+def logged_samples(log_dir: str, before: datetime | None = None) -> list[tuple[dict[str, float], int]]:
+    # (features, evaluator score) of every execution scored in the log files, per project of a batch
+    samples = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "TestSuite.log*"))):
+        executions, project = {}, None
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = LOG_LINE.match(line)
+                if not match:
+                    if project in executions:  # continued message, e.g. a traceback
+                        executions[project][1].append(line)
+                    continue
+                timestamp, project, message = match.groups()
+                if message.startswith("Execution of the generated test suite done!"):
+                    executions[project] = (datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S,%f"), [message])
+                elif message.startswith("Analyse Score: ") and project in executions:
+                    time, text = executions.pop(project)
+                    features = _logged_features("\n".join(text))
+                    if features is not None and (before is None or time < before):
+                        samples.append((features, int(message.removeprefix("Analyse Score: "))))
+                elif project in executions:
+                    executions[project][1].append(message)
+    return samples
+
+
+def _invert(matrix: list[list[float]]) -> list[list[float]]:
+    # gauss-jordan elimination with partial pivoting
+    n = len(matrix)
+    augmented = [row[:] + [float(i == j) for j in range(n)] for i, row in enumerate(matrix)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(augmented[row][column]))
+        augmented[column], augmented[pivot] = augmented[pivot], augmented[column]
+        divisor = augmented[column][column]
+        augmented[column] = [value / divisor for value in augmented[column]]
+        for row in range(n):
+            if row != column and augmented[row][column]:
+                factor = augmented[row][column]
+                augmented[row] = [value - factor * pivot_value
+                                  for value, pivot_value in zip(augmented[row], augmented[column])]
+    return [row[n:] for row in augmented]
+
+
+class ScorePredictor:
+    # ridge regression of the evaluator score on local features of the execution, trained from the scores in the log
+    # files and the score history every evaluator response is added to
+    def __init__(self, path: str = SCORE_HISTORY, log_dir: str | None = "logs", ridge: float = PREDICTOR_RIDGE):
+        self.path = path
+        self.ridge = ridge
+        self._lock = threading.Lock()
+        history = []
+        try:
+            with open(path, "r") as f:
+                history = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            pass
+        # executions in the history are logged as well
+        first = min((datetime.fromisoformat(entry["time"]) for entry in history), default=None)
+        self.samples = (logged_samples(log_dir, first) if log_dir else []) + \
+            [(entry["features"], entry["score"]) for entry in history]
+        self._fit()
+
+    def _fit(self):
+        self._model = None
+        n = len(self.samples)
+        if n < PREDICTOR_MIN_SAMPLES:
+            return
+
+        rows = [[features.get(name, 0.0) for name in FEATURES] for features, _ in self.samples]
+        scores = [score for _, score in self.samples]
+        means = [sum(column) / n for column in zip(*rows)]
+        scales = [math.sqrt(sum((value - mean) ** 2 for value in column) / n) or 1.0
+                  for column, mean in zip(zip(*rows), means)]
+        x = [[(value - mean) / scale for value, mean, scale in zip(row, means, scales)] for row in rows]
+        mean_score = sum(scores) / n
+
+        # (X'X + ridge I) w = X'y on standardized features, the intercept (mean score) is not penalized
+        p = len(FEATURES)
+        gram = [[sum(row[i] * row[j] for row in x) + (self.ridge if i == j else 0.0) for j in range(p)]
+                for i in range(p)]
+        inverse = _invert(gram)
+        xty = [sum(row[i] * (score - mean_score) for row, score in zip(x, scores)) for i in range(p)]
+        weights = [sum(inverse[i][j] * xty[j] for j in range(p)) for i in range(p)]
+
+        residuals = [score - mean_score - sum(w * value for w, value in zip(weights, row))
+                     for row, score in zip(x, scores)]
+        # effective degrees of freedom of the ridge fit: trace of X (X'X + ridge I)^-1 X'
+        hat_trace = sum(inverse[i][j] * (gram[j][i] - (self.ridge if i == j else 0.0))
+                        for i in range(p) for j in range(p))
+        variance = sum(residual ** 2 for residual in residuals) / max(n - 1 - hat_trace, 1.0)
+        self._model = (means, scales, mean_score, weights, inverse, variance, n)
+
+    def predict(self, execution: ExecutionResult) -> tuple[float, float] | None:
+        # predicted score and half width of its confidence interval, None before enough scores are known
+        if self._model is None:
+            return None
+        means, scales, mean_score, weights, inverse, variance, n = self._model
+        features = execution_features(execution)
+        x = [(features.get(name, 0.0) - mean) / scale for name, mean, scale in zip(FEATURES, means, scales)]
+        score = mean_score + sum(w * value for w, value in zip(weights, x))
+        leverage = sum(x[i] * inverse[i][j] * x[j] for i in range(len(x)) for j in range(len(x)))
+        return score, PREDICTOR_CONFIDENCE_Z * math.sqrt(variance * (1 + 1 / n + leverage))
+
+    def decide(self, execution: ExecutionResult) -> dict | None:
+        # predicted score and local feedback if the prediction is confident, None if the evaluator has to judge
+        prediction = self.predict(execution)
+        if prediction is None:
+            return None
+        score, interval = prediction
+        # a score above the threshold ends the run, only the evaluator gives one
+        if interval > PREDICTOR_MAX_INTERVAL or score + interval > SCORE_THRESHOLD:
+            LOGGER.debug(f"Predicted score {score:.0f} +- {interval:.0f} is not confident enough for a decision")
+            return None
+        score = min(max(round(score), 0), 100)
+        LOGGER.info(f"Test suite scored {score} (+- {interval:.0f}) by the score predictor without the evaluator")
+        return {"score": score, "feedback": local_feedback(execution)}
+
+    def record(self, execution: ExecutionResult, score: int, project: str | None = None):
+        entry = {"time": datetime.now().isoformat(), "project": project, "features": execution_features(execution),
+                 "score": score}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.samples.append((entry["features"], score))
+            self._fit()
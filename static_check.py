@@ -0,0 +1,315 @@
+import ast
+import builtins
+import difflib
+import enum
+import importlib.util
+import os
+from dataclasses import dataclass, field
+
+from utils import parse_source
+
+ENUM_BASES = {"Enum", "IntEnum", "StrEnum", "Flag", "IntFlag"}
+# available on every enum class besides its members and methods
+ENUM_ATTRIBUTES = set(dir(enum.Enum)) | set(dir(enum.EnumMeta)) | {"_member_map_", "_member_names_",
+                                                                   "_value2member_map_"}
+MODULE_ATTRIBUTES = {"__file__", "__name__", "__doc__", "__spec__", "__loader__", "__package__", "__builtins__"}
+MAX_DIAGNOSTICS = 20
+
+
+@dataclass
+class Signature:
+    positional: list[str]
+    required: set[str]
+    keyword_only: set[str] = field(default_factory=set)
+    var_positional: bool = False
+    var_keyword: bool = False
+
+    @classmethod
+    def of_function(cls, node: ast.FunctionDef | ast.AsyncFunctionDef, method: bool = False):
+        args = node.args
+        positional = [arg.arg for arg in args.posonlyargs + args.args][1 if method else 0:]
+        required = set(positional[:len(positional) - len(args.defaults)])
+        required |= {arg.arg for arg, default in zip(args.kwonlyargs, args.kw_defaults) if default is None}
+        return cls(positional, required, {arg.arg for arg in args.kwonlyargs}, args.vararg is not None,
+                   args.kwarg is not None)
+
+    @classmethod
+    def of_dataclass(cls, node: ast.ClassDef):
+        fields, required = [], set()
+        for member in node.body:
+            if not isinstance(member, ast.AnnAssign) or not isinstance(member.target, ast.Name) \
+                    or "ClassVar" in ast.unparse(member.annotation):
+                continue
+            options = {keyword.arg for keyword in member.value.keywords} \
+                if isinstance(member.value, ast.Call) and ast.unparse(member.value.func).endswith("field") else None
+            if options is not None and any(keyword.arg == "init" and isinstance(keyword.value, ast.Constant)
+                                           and keyword.value.value is False for keyword in member.value.keywords):
+                continue
+            fields.append(member.target.id)
+            if member.value is None or (options is not None and not options & {"default", "default_factory"}):
+                required.add(member.target.id)
+        return cls(fields, required)
+
+    def problems(self, call: ast.Call, name: str) -> list[str]:
+        if any(isinstance(arg, ast.Starred) for arg in call.args) or any(kw.arg is None for kw in call.keywords):
+            return []
+        problems = []
+        if len(call.args) > len(self.positional) and not self.var_positional:
+            problems.append(f"{name}() takes {len(self.positional)} positional arguments but {len(call.args)} "
+                            f"were given (parameters: {', '.join(self.positional) or 'none'})")
+        given = set(self.positional[:len(call.args)])
+        for keyword in call.keywords:
+            if keyword.arg not in self.positional and keyword.arg not in self.keyword_only and not self.var_keyword:
+                problems.append(f"{name}() got an unexpected keyword argument '{keyword.arg}'"
+                                f"{_suggestion(keyword.arg, self.positional + sorted(self.keyword_only))}")
+            given.add(keyword.arg)
+        missing = [param for param in self.positional + sorted(self.keyword_only)
+                   if param in self.required and param not in given]
+        if missing:
+            problems.append(f"{name}() is missing the required arguments {', '.join(missing)}")
+        return problems
+
+
+@dataclass
+class ProjectClass:
+    name: str
+    members: set[str]  # names defined in the class body
+    enum: bool = False
+    values: list = field(default_factory=list)  # of the enum members
+    constructor: Signature | None = None  # None if not known from the class itself
+
+
+def _suggestion(name: str, candidates) -> str:
+    # of the closest matches the one sharing the longest prefix, e.g. TokenLocation rather than Token for TokenLoc
+    matches = difflib.get_close_matches(name, list(candidates), n=3)
+    if not matches:
+        return ""
+    return f" (did you mean {max(matches, key=lambda match: len(os.path.commonprefix([match, name])))}?)"
+
+
+def _is_dataclass(node: ast.ClassDef) -> bool:
+    return any(ast.unparse(decorator).split("(")[0].endswith("dataclass") for decorator in node.decorator_list)
+
+
+def is_enum(node: ast.ClassDef) -> bool:
+    return any((base.id if isinstance(base, ast.Name) else getattr(base, "attr", None)) in ENUM_BASES
+               for base in node.bases)
+
+
+def _project_class(node: ast.ClassDef) -> ProjectClass:
+    members, values = set(), []
+    for member in node.body:
+        if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            members.add(member.name)
+        for target in member.targets if isinstance(member, ast.Assign) else \
+                [member.target] if isinstance(member, ast.AnnAssign) else []:
+            if isinstance(target, ast.Name):
+                members.add(target.id)
+                if isinstance(member.value, ast.Constant):
+                    values.append(member.value.value)
+
+    enum_class = is_enum(node)
+    constructor = None
+    if _is_dataclass(node) and not node.bases:
+        constructor = Signature.of_dataclass(node)
+    elif not node.bases and "__new__" not in members:
+        inits = [member for member in node.body if isinstance(member, ast.FunctionDef) and member.name == "__init__"]
+        constructor = Signature.of_function(inits[0], method=True) if inits else Signature([], set())
+    return ProjectClass(node.name, members, enum_class, values if enum_class else [], constructor)
+
+
+def _top_level(statements: list[ast.stmt]):
+    # statements run when the module is imported, including those in if/try/with blocks
+    for node in statements:
+        if isinstance(node, ast.If) and ast.unparse(node.test) in ("__name__ == '__main__'", "'__main__' == __name__"):
+            continue
+        yield node
+        if isinstance(node, (ast.If, ast.For, ast.While, ast.With, ast.Try)):
+            for block in (node.body, getattr(node, "orelse", []), getattr(node, "finalbody", [])):
+                yield from _top_level(block)
+            for handler in getattr(node, "handlers", []):
+                yield from _top_level(handler.body)
+
+
+class ProjectSymbols:
+    # names the modules of <project_dir>/src define, read from their sources without importing them
+    def __init__(self, project_dir: str):
+        self.modules: dict[str, dict[str, object]] = {}
+        src_dir = os.path.join(project_dir, "src")
+        if os.path.isdir(src_dir):
+            self.modules["src"] = {}
+        for root, dirs, files in os.walk(src_dir):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for file in sorted(f for f in files if f.endswith(".py")):
+                parts = os.path.relpath(os.path.join(root, file), project_dir)[:-3].split(os.sep)
+                module = ".".join(parts[:-1] if parts[-1] == "__init__" else parts)
+                with open(os.path.join(root, file), "r") as f:
+                    try:
+                        tree = parse_source(f.read())
+                    except SyntaxError:
+                        tree = ast.Module(body=[], type_ignores=[])
+                self.modules[module] = self._names(module, parts[-1] == "__init__", tree)
+
+    @staticmethod
+    def _names(module: str, package: bool, tree: ast.Module) -> dict[str, object]:
+        # a ProjectClass, the Signature of a function, (module, name) of an imported name or None for anything else
+        names = {}
+        for node in _top_level(tree.body):
+            if isinstance(node, ast.ClassDef):
+                names[node.name] = _project_class(node)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names[node.name] = Signature.of_function(node)
+            elif isinstance(node, ast.ImportFrom):
+                base = module.split(".") if package else module.split(".")[:-1]
+                source = ".".join(base[:len(base) - node.level + 1] + ([node.module] if node.module else [])) \
+                    if node.level else node.module
+                for alias in node.names:
+                    names[alias.asname or alias.name] = (source, alias.name)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    names[alias.asname or alias.name.split(".")[0]] = None
+            elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+                for target in node.targets if isinstance(node, ast.Assign) else [node.target]:
+                    for name in ast.walk(target):
+                        if isinstance(name, ast.Name):
+                            names[name.id] = None
+        return names
+
+    def has(self, module: str, name: str) -> bool:
+        return name in self.modules.get(module, {}) or f"{module}.{name}" in self.modules
+
+    def resolve(self, module: str, name: str, depth: int = 0) -> object:
+        value = self.modules.get(module, {}).get(name)
+        if isinstance(value, tuple) and depth < 10:
+            return self.resolve(*value, depth + 1)
+        return value if not isinstance(value, tuple) else None
+
+
+def _is_project(module: str) -> bool:
+    return module == "src" or module.startswith("src.")
+
+
+def _bound_names(tree: ast.Module) -> dict[str, int]:
+    # how often every name is bound anywhere in the module
+    bound = {}
+
+    def bind(name: str):
+        bound[name] = bound.get(name, 0) + 1
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bind(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bind(node.name)
+        elif isinstance(node, ast.arg):
+            bind(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                bind(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bind(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            for name in node.names:
+                bind(name)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bind(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bind(node.rest)
+    return bound
+
+
+def _check_imports(tree: ast.Module, symbols: ProjectSymbols, problems: list[tuple[int, str]]) -> dict[str, object]:
+    # project names bound by the imports of the suite
+    imported = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level:
+            problems.append((node.lineno, "relative imports do not work in tests.py, import from src instead"))
+        elif isinstance(node, ast.ImportFrom) and _is_project(node.module):
+            if node.module not in symbols.modules:
+                problems.append((node.lineno, f"there is no module {node.module} in the project"
+                                              f"{_suggestion(node.module, symbols.modules)}"))
+                continue
+            for alias in node.names:
+                if alias.name == "*":
+                    imported.update({name: symbols.resolve(node.module, name) for name in symbols.modules[node.module]})
+                elif not symbols.has(node.module, alias.name):
+                    names = [name for name in symbols.modules[node.module] if not name.startswith("_")]
+                    problems.append((node.lineno, f"{node.module} has no name {alias.name}"
+                                                  f"{_suggestion(alias.name, names)}; it defines {', '.join(names)}"))
+                else:
+                    imported[alias.asname or alias.name] = symbols.resolve(node.module, alias.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for module in [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module]:
+                if _is_project(module):
+                    if module not in symbols.modules:
+                        problems.append((node.lineno, f"there is no module {module} in the project"
+                                                      f"{_suggestion(module, symbols.modules)}"))
+                    continue
+                try:
+                    found = importlib.util.find_spec(module.split(".")[0]) is not None
+                except (ImportError, ValueError):
+                    found = False
+                if not found:
+                    problems.append((node.lineno, f"the module {module} is not available, only use the standard "
+                                                  f"library and the project"))
+    return imported
+
+
+def check_suite(tests_str: str, project_dir: str) -> list[str]:
+    # problems that keep the suite from running at all, found without executing it
+    try:
+        tree = parse_source(tests_str)
+    except SyntaxError as e:
+        return [f"line {e.lineno}: {e.msg}" + (f": {e.text.strip()}" if e.text else "")]
+
+    symbols = ProjectSymbols(project_dir)
+    problems: list[tuple[int, str]] = []
+    imported = _check_imports(tree, symbols, problems)
+    bound = _bound_names(tree)
+    # project names that are not rebound by the suite itself
+    project = {name: value for name, value in imported.items() if value is not None and bound.get(name) == 1}
+
+    star_import = any(isinstance(node, ast.ImportFrom) and not _is_project(node.module or "")
+                      and any(alias.name == "*" for alias in node.names) for node in ast.walk(tree))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in bound \
+                and node.id not in imported and not hasattr(builtins, node.id) and node.id not in MODULE_ATTRIBUTES \
+                and not star_import:
+            # the defining module before those importing the name
+            modules = sorted((module for module, names in symbols.modules.items() if node.id in names),
+                             key=lambda module: isinstance(symbols.modules[module][node.id], tuple))
+            hint = f", import it from {modules[0]}" if modules else _suggestion(node.id, bound)
+            problems.append((node.lineno, f"the name {node.id} is not defined{hint}"))
+        elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) \
+                and isinstance(project.get(node.value.id), ProjectClass) and project[node.value.id].enum:
+            cls = project[node.value.id]
+            if node.attr not in cls.members and node.attr not in ENUM_ATTRIBUTES:
+                members = sorted(member for member in cls.members if not member.startswith("_"))
+                problems.append((node.lineno, f"{cls.name} has no member {node.attr}{_suggestion(node.attr, members)}; "
+                                              f"its members are {', '.join(members)}"))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in project:
+            value = project[node.func.id]
+            if isinstance(value, ProjectClass) and value.enum:
+                if len(node.args) == 1 and not node.keywords and isinstance(node.args[0], ast.Constant) \
+                        and value.values and node.args[0].value not in value.values:
+                    problems.append((node.lineno, f"{node.args[0].value!r} is not a valid {value.name} value"
+                                                  f"{_suggestion(str(node.args[0].value), map(str, value.values))}"))
+            elif isinstance(value, ProjectClass) and value.constructor:
+                problems += [(node.lineno, problem) for problem in value.constructor.problems(node, value.name)]
+            elif isinstance(value, Signature):
+                problems += [(node.lineno, problem) for problem in value.problems(node, node.func.id)]
+
+    tests = [member for node in ast.walk(tree) if isinstance(node, ast.ClassDef) for member in node.body
+             if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef)) and member.name.startswith("test")]
+    if not tests:
+        problems.append((1, "the suite defines no test methods (test_* methods of unittest.TestCase subclasses)"))
+
+    return [f"line {line}: {message}" for line, message in sorted(set(problems))]
+
+
+def check_feedback(problems: list[str]) -> str:
+    shown = problems[:MAX_DIAGNOSTICS]
+    more = f"\n- ... {len(problems) - len(shown)} more problems" if len(problems) > len(shown) else ""
+    return ("The test suite was rejected before execution because it can not run as it is:\n"
+            + "\n".join(f"- {problem}" for problem in shown) + more
+            + "\nOnly use modules, names, members and arguments that exist in the project files.")
@@ -0,0 +1,82 @@
+import contextlib
+import json
+import os
+import signal
+import tempfile
+from dataclasses import dataclass
+
+from constants import EXECUTION_TIMEOUT, EXECUTION_CPU_SECONDS, EXECUTION_MEMORY_BYTES, TEST_TIMEOUT
+from results import ExecutionResult, TestOutcome, ERROR
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+@dataclass
+class ExecutionLimits:
+    # None disables a limit
+    timeout: float | None = EXECUTION_TIMEOUT  # wall-clock seconds of a whole run
+    cpu_seconds: int | None = EXECUTION_CPU_SECONDS  # of the test process
+    memory_bytes: int | None = EXECUTION_MEMORY_BYTES  # address space of the test process
+    test_timeout: float | None = TEST_TIMEOUT  # wall-clock seconds of a single test
+
+
+def _set_soft_limit(kind: int, value: int):
+    soft, hard = resource.getrlimit(kind)
+    resource.setrlimit(kind, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+
+def apply_resource_limits(limits: ExecutionLimits | None):
+    # soft limits only, so a warm worker can raise them again for its next run; CPU time is counted from now on
+    if resource is None or limits is None:
+        return
+    if limits.cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _set_soft_limit(resource.RLIMIT_CPU, int(usage.ru_utime + usage.ru_stime) + limits.cpu_seconds)
+    if limits.memory_bytes:
+        _set_soft_limit(resource.RLIMIT_AS, limits.memory_bytes)
+
+
+def timeout_message(timeout: float | None) -> str:
+    return f"The execution of the test suite was stopped after its wall-clock time limit of {timeout}s\n"
+
+
+def crash_message(exit_code: int | None) -> str:
+    if exit_code is not None and exit_code < 0:
+        # e.g. SIGXCPU once the CPU time limit is exceeded
+        return (f"The test process was killed by {signal.Signals(-exit_code).name} during the execution of the "
+                f"test suite (exit code {exit_code})\n")
+    return f"The test process crashed during the execution of the test suite (exit code {exit_code})\n"
+
+
+@contextlib.contextmanager
+def journal_file():
+    # the test process appends every test it starts and finishes, read if the process has to be killed
+    fd, path = tempfile.mkstemp(prefix="testsuitegen_journal_", suffix=".jsonl")
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+def partial_result(journal: str, error: str, duration: float = 0.0) -> ExecutionResult:
+    # outcomes of the tests finished before the test process died, the test running at that time is an error
+    tests, running = [], None
+    with contextlib.suppress(OSError), open(journal, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # written partially
+            if "started" in entry:
+                running = entry["started"]
+            else:
+                tests.append(TestOutcome(**entry))
+                running = None
+    if running is not None:
+        tests.append(TestOutcome(running, ERROR, exception="Killed", message=error.strip()))
+    return ExecutionResult(tests, duration, error=error)
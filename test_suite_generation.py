@@ -1,27 +1,62 @@
+import argparse
+import asyncio
+import contextvars
+import copy
 import json
 import logging
 import logging.handlers as handlers
 import os
-from time import sleep
+import time
 
 import seedir
-import subprocess
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from datetime import datetime
 from dotenv import load_dotenv
+from typing import Callable
 from typing_extensions import TypedDict
 
-from constants import MODEL_NAME, LOGGING_LEVEL
-from utils import clean_python_response
+from constants import MODEL_NAME, RATE_LIMITS, MAX_RETRIES, LOGGER_NAME, LOGGING_LEVEL, MAX_ITERATIONS, \
+    SCORE_THRESHOLD, CANDIDATES, CANDIDATE_SELECTION, PROJECT_DIR, CONVERGENCE_MIN_GAIN, \
+    CONVERGENCE_SWITCH_CANDIDATES, CONTEXT_MODE, CONTEXT_CACHE_TTL, EXECUTOR, EXECUTION_TIMEOUT, \
+    EXECUTION_CPU_SECONDS, EXECUTION_MEMORY_BYTES, TEST_TIMEOUT, MUTATION_TESTING, LOCAL_DECISION, \
+    SCORE_PREDICTOR, PREDICTOR_MAX_CONSECUTIVE, TOKEN_MODULE
+from cache import ResponseCache, conversation_key
+from cassette import Cassette
+from checkpoint import Checkpoint, PipelineState, GENERATED, EXECUTED, EVALUATED
+from convergence import ConvergenceDetector, Decision
+from decision import decide_locally
+from executors import EXECUTORS, Executor, SubprocessExecutor, create_executor
+from mutation import MutationTester
+from compression import execution_prompt
+from results import ExecutionResult
+from rate_limiter import Priority, RateLimiter, estimate_tokens, retry_delay, CHARS_PER_TOKEN
+from sandbox import Sandbox
+from score_predictor import ScorePredictor
+from static_check import check_feedback, check_suite
+from supervisor import ExecutionLimits
+from token_coverage import token_feedback
+from utils import clean_python_response, read_project_sources, save_tests
+
+# name of the project processed by the current (batch) task, prefixed to its log messages
+PROJECT_CONTEXT = contextvars.ContextVar("project", default=None)
+
+
+class ProjectLogFilter(logging.Filter):
+    def filter(self, record):
+        project = PROJECT_CONTEXT.get()
+        record.project = f"[{project}] " if project else ""
+        return True
+
 
 os.makedirs("logs", exist_ok=True)
-LOGGER = logging.getLogger(__name__)
-log_f = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+LOGGER = logging.getLogger(LOGGER_NAME)
+log_f = logging.Formatter('%(asctime)s - %(levelname)s - %(project)s%(message)s')
 rf_handler = handlers.RotatingFileHandler(filename="logs/TestSuite.log", maxBytes=100 * 1024, backupCount=5)  # 100kB
 stream_handler = logging.StreamHandler()
 rf_handler.setFormatter(log_f), stream_handler.setFormatter(log_f)
+rf_handler.addFilter(ProjectLogFilter()), stream_handler.addFilter(ProjectLogFilter())
 LOGGER.addHandler(rf_handler), LOGGER.addHandler(stream_handler)
 LOGGER.setLevel(LOGGING_LEVEL)
 
@@ -29,28 +64,194 @@ load_dotenv()
 
 
 class Chat:
-    def __init__(self, name: str, api_key: str, model_name: str, config: types.GenerateContentConfig):
+    def __init__(self, name: str, api_key: str, model_name: str, config: types.GenerateContentConfig,
+                 limiter: RateLimiter | None = None, priority: Priority = Priority.GENERATOR,
+                 project_dir: str = PROJECT_DIR, cache: ResponseCache | None = None,
+                 cassette: Cassette | None = None, context_mode: str = CONTEXT_MODE):
         self.name = name
-        self.client = genai.Client(api_key=api_key)
+        self.project_dir = project_dir
+        self.model_name = model_name
+        self.config = config
+        self.limiter = limiter
+        self.priority = priority
+        self.cache = cache
+        self.cassette = cassette
+        self.sample = 0
+        self.usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "saved_tokens": 0}  # shared with forks
+        # GEMINI_BASE_URL points the client to another endpoint, e.g. the local mock_server.py
+        base_url = os.getenv("GEMINI_BASE_URL")
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        # replayed runs never talk to the API (and need no key)
+        self.client = None if cassette and cassette.replaying else genai.Client(api_key=api_key,
+                                                                                http_options=http_options)
 
         LOGGER.info(f"Reading in project files ({self.name})...")
-        with open("project/src/lexer.py", "r") as f:
-            self.lex_str = f.read()
-        with open("project/src/tokens.py", "r") as f:
-            self.tok_str = f.read()
-
-        self.chat = self.client.chats.create(model=model_name, config=config)
+        self.sources = read_project_sources(project_dir)
+
+        self.history: list[types.Content] = []
+
+        # "inline": project files in every message, "history": only in the first message of the conversation,
+        # "cache": in an API context cache (falls back to "history" if it can not be created)
+        self.context_mode = context_mode
+        self._context_cached = False
+        if context_mode == "cache":
+            self._create_context_cache()
+
+    def _sources_str(self) -> str:
+        return "".join(f" - {name}\n```python\n{content}\n```\n" for name, content in self.sources.items())
+
+    def _create_context_cache(self):
+        try:
+            if self.client is None:
+                raise ValueError("no API client")
+            context = self.client.caches.create(model=self.model_name, config=types.CreateCachedContentConfig(
+                display_name=f"TestSuiteGen {self.name}", ttl=CONTEXT_CACHE_TTL,
+                system_instruction=self.config.system_instruction,
+                contents=[types.UserContent(parts=[types.Part.from_text(
+                    text=f"These are the project file contents:{self._sources_str()}")])]))
+        except (errors.APIError, ValueError) as e:
+            LOGGER.warning(f"Context cache for {self.name} could not be created ({e}), "
+                           f"sending the project files once per conversation instead.")
+            self.context_mode = "history"
+            return
+
+        LOGGER.info(f"Created context cache {context.name} for {self.name}")
+        self.config = self.config.model_copy(update={"cached_content": context.name, "system_instruction": None})
+        self._context_cached = True
+
+    def _project_files(self, prefix: str = "These are the project file contents:") -> str:
+        if self.context_mode == "inline" or (self.context_mode == "history" and not self.history) \
+                or (self.context_mode == "cache" and not self._context_cached):
+            return prefix + self._sources_str()
+
+        self.usage["saved_tokens"] += len(self._sources_str()) // CHARS_PER_TOKEN
+        return "The project file contents were provided at the start of this conversation and are unchanged.\n"
+
+    def fork(self, sample: int = 0):
+        # independent continuation of the conversation (sharing client, limiter and cache)
+        forked = copy.copy(self)
+        forked.history = list(self.history)
+        forked.sample = sample
+        return forked
+
+    def _request_contents(self, message: str) -> list[types.Content]:
+        return self.history + [types.UserContent(parts=[types.Part.from_text(text=message)])]
+
+    def _cached_response(self, contents: list[types.Content]) -> tuple[str | None, str | None]:
+        if not self.cache:
+            return None, None
+
+        key = conversation_key(self.model_name, self.config, contents, self.sample)
+        cached = self.cache.get_content(key)
+        if cached is None:
+            return key, None
+
+        LOGGER.debug(f"Serving request of {self.name} from the response cache ({key[:12]})")
+        content, text = cached
+        self.history = contents + [content]
+        return key, text
+
+    def _record_response(self, contents: list[types.Content], res: types.GenerateContentResponse,
+                         estimated_tokens: int, cache_key: str | None) -> str:
+        if self.limiter:
+            used_tokens = res.usage_metadata.total_token_count if res.usage_metadata else None
+            self.limiter.settle(self.model_name, estimated_tokens, used_tokens)
+        if res.usage_metadata:
+            self.usage["prompt_tokens"] += res.usage_metadata.prompt_token_count or 0
+            self.usage["cached_tokens"] += res.usage_metadata.cached_content_token_count or 0
+
+        if res.candidates and res.candidates[0].content:
+            self.history = contents + [res.candidates[0].content]
+            if cache_key and res.text is not None:
+                self.cache.put_content(cache_key, self.model_name, res.candidates[0].content, res.text)
+
+        return res.text
+
+    def _retry_delay(self, error: errors.APIError, attempt: int) -> float:
+        delay = retry_delay(error, attempt)
+        if delay is None or attempt >= MAX_RETRIES:
+            raise error
+
+        LOGGER.warning(f"Request of {self.name} failed ({error.code}), retrying in {delay:.1f}s...")
+        if self.limiter:
+            self.limiter.backoff(self.model_name, delay)
+        return delay
+
+    def _generate(self, contents: list[types.Content]) -> types.GenerateContentResponse:
+        self.usage["requests"] += 1
+        if self.cassette and self.cassette.replaying:
+            return self.cassette.replay(self.model_name, self.config, contents, self.sample)
+
+        start = time.monotonic()
+        res = self.client.models.generate_content(model=self.model_name, contents=contents, config=self.config)
+        if self.cassette:
+            self.cassette.record(self.name, self.model_name, self.config, contents, self.sample, res,
+                                 time.monotonic() - start)
+        return res
+
+    async def _generate_async(self, contents: list[types.Content]) -> types.GenerateContentResponse:
+        self.usage["requests"] += 1
+        if self.cassette and self.cassette.replaying:
+            return await self.cassette.replay_async(self.model_name, self.config, contents, self.sample)
+
+        start = time.monotonic()
+        res = await self.client.aio.models.generate_content(model=self.model_name, contents=contents,
+                                                            config=self.config)
+        if self.cassette:
+            self.cassette.record(self.name, self.model_name, self.config, contents, self.sample, res,
+                                 time.monotonic() - start)
+        return res
+
+    def send_message(self, message: str) -> str:
+        contents = self._request_contents(message)
+        cache_key, cached = self._cached_response(contents)
+        if cached is not None:
+            return cached
+
+        tokens = estimate_tokens(contents, self.config)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if self.limiter:
+                self.limiter.acquire(self.model_name, tokens, self.priority)
+            try:
+                res = self._generate(contents)
+                return self._record_response(contents, res, tokens, cache_key)
+            except errors.APIError as e:
+                delay = self._retry_delay(e, attempt)
+            if not self.limiter:
+                time.sleep(delay)
+
+    async def send_message_async(self, message: str) -> str:
+        contents = self._request_contents(message)
+        cache_key, cached = self._cached_response(contents)
+        if cached is not None:
+            return cached
+
+        tokens = estimate_tokens(contents, self.config)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if self.limiter:
+                await self.limiter.acquire_async(self.model_name, tokens, self.priority)
+            try:
+                res = await self._generate_async(contents)
+                return self._record_response(contents, res, tokens, cache_key)
+            except errors.APIError as e:
+                delay = self._retry_delay(e, attempt)
+            if not self.limiter:
+                await asyncio.sleep(delay)
 
 
 class TestGenChat(Chat):
-    def __init__(self, api_key: str, model_name: str):
+    def __init__(self, api_key: str, model_name: str, limiter: RateLimiter | None = None,
+                 project_dir: str = PROJECT_DIR, cache: ResponseCache | None = None,
+                 cassette: Cassette | None = None, context_mode: str = CONTEXT_MODE):
         sys_prompt = f"""
 
 Your are a software tester, specialized on working with python projects.
 Your goal is to write a test suite for the given python project using the python testing framework `unittest`!
 
 The project has the following structure:
-{seedir.seedir("project", printout=False)}
+{seedir.seedir(project_dir, printout=False)}
 
 You will be provided all files in the src/ folder.
 Additionally, feedback to the generated tests.py will be provided.
@@ -63,36 +264,57 @@ For the given project files only answer with the contents of the tests.py file.
 """.strip()
 
         super().__init__("TS Generator", api_key, model_name,
-                         types.GenerateContentConfig(system_instruction=sys_prompt))
+                         types.GenerateContentConfig(system_instruction=sys_prompt), limiter, Priority.GENERATOR,
+                         project_dir, cache, cassette, context_mode)
 
-    @staticmethod
-    def _save_test_suite(content: str):
-        with open("project/tests.py", "w") as tests_file:
-            tests_file.write(clean_python_response(content))
+    def _save_test_suite(self, content: str) -> str:
+        content = clean_python_response(content)
+        save_tests(self.project_dir, content)
 
+        project = os.path.basename(os.path.normpath(self.project_dir))
         date, time = datetime.now().strftime("%Y-%m-%d/%H_%M_%S").split("/")
-        os.makedirs(f"logs/suites/{date}", exist_ok=True)
-        with open(f"logs/suites/{date}/tests_{time}.py", "w") as tests_log:
-            LOGGER.debug(f"Saving suite to logs/suites/{date}/tests_{time}.py")
-            tests_log.write(clean_python_response(content))
+        os.makedirs(f"logs/suites/{date}/{project}", exist_ok=True)
+        with open(f"logs/suites/{date}/{project}/tests_{time}.py", "w") as tests_log:
+            LOGGER.debug(f"Saving suite to logs/suites/{date}/{project}/tests_{time}.py")
+            tests_log.write(content)
+
+        return content
+
+    def _init_message(self) -> str:
+        return self._project_files()
+
+    def _redo_message(self, feedback: str) -> str:
+        return ("Your generated test suite was analysed. This is the feedback:\n\n"
+                f"{feedback}\n\nPlease update the test suite accordingly."
+                f"{self._project_files()}")
 
     def init_testsuite(self):
         LOGGER.info("Sending initial test suite request...")
-        res = self.chat.send_message(message=f"These are the project file contents:"
-                                             f" - lexer.py\n```python\n{self.lex_str}\n```\n"
-                                             f" - tokens.py\n```python\n{self.tok_str}\n```\n")
+        res = self.send_message(self._init_message())
+        LOGGER.info("Received initial test suite!")
+        return self._save_test_suite(res)
+
+    async def init_testsuite_async(self):
+        LOGGER.info("Sending initial test suite request...")
+        res = await self.send_message_async(self._init_message())
         LOGGER.info("Received initial test suite!")
-        self._save_test_suite(res.text)
+        return self._save_test_suite(res)
 
     def redo_testsuite(self, feedback: str):
         LOGGER.info("Sending feedback for generation of new test suite...")
-        res = self.chat.send_message(message="Your generated test suite was analysed. This is the feedback:\n\n"
-                                             f"{feedback}\n\nPlease update the test suite accordingly."
-                                             f"These are the project file contents:"
-                                             f" - lexer.py\n```python\n{self.lex_str}\n```\n"
-                                             f" - tokens.py\n```python\n{self.tok_str}\n```\n")
+        res = self.send_message(self._redo_message(feedback))
         LOGGER.info("Received updated test suite!")
-        self._save_test_suite(res.text)
+        return self._save_test_suite(res)
+
+    async def redo_testsuite_async(self, feedback: str):
+        LOGGER.info("Sending feedback for generation of new test suite...")
+        res = await self.send_message_async(self._redo_message(feedback))
+        LOGGER.info("Received updated test suite!")
+        return self._save_test_suite(res)
+
+    async def candidate_testsuite_async(self, feedback: str | None) -> str:
+        message = self._init_message() if feedback is None else self._redo_message(feedback)
+        return clean_python_response(await self.send_message_async(message))
 
 
 class TestEvalChat(Chat):
@@ -100,17 +322,22 @@ class TestEvalChat(Chat):
         score: int
         feedback: str
 
-    def __init__(self, api_key: str, model_name: str):
+    def __init__(self, api_key: str, model_name: str, limiter: RateLimiter | None = None,
+                 project_dir: str = PROJECT_DIR, cache: ResponseCache | None = None,
+                 cassette: Cassette | None = None, context_mode: str = CONTEXT_MODE):
         sys_prompt = f"""
 
 Your are a software tester, specialized on working with python projects.
 I will provide you a project as well as a proposed set of test cases.
 
 The project has the following structure:
-{seedir.seedir("project", printout=False)}
+{seedir.seedir(project_dir, printout=False)}
 
 You will be provided all files in the src/ folder as well as the test suite in tests.py.
-Additionally, I will provide you the output of the execution of the test suite.
+Additionally, I will provide you the result of the execution of the test suite as JSON, including the line and branch
+coverage of src/ measured while it ran and the branches it never took, and the mutation score of the test suite with the
+mutants of src/ (small changes of the code, e.g. a flipped comparison) that none of its passing tests detected, and
+which token kinds, compound operators and line/column edge cases the tests made the lexer handle.
 
 It is important that you only analyse errors in the test suite.
 Consider the project files to hold the correct behavior!
@@ -132,60 +359,397 @@ Only answer in JSON format as follows:
         super().__init__("TS Evaluator", api_key, model_name,
                          types.GenerateContentConfig(system_instruction=sys_prompt,
                                                      response_mime_type="application/json",
-                                                     response_schema=self.EvalResponse))
+                                                     response_schema=self.EvalResponse),
+                         limiter, Priority.EVALUATOR, project_dir, cache, cassette, context_mode)
 
-    def analyse_testsuite(self, execution_output: str):
-        with open("project/tests.py", "r") as f:
-            tests_str = f.read()
+    def _analyse_message(self, execution: ExecutionResult, tests_str: str | None = None) -> str:
+        if tests_str is None:
+            with open(os.path.join(self.project_dir, "tests.py"), "r") as f:
+                tests_str = f.read()
 
-        LOGGER.info("Sending test suite analyse request...")
-        res = self.chat.send_message(message=execution_output + f"These are the project file contents:\n"
-                                                                f" - lexer.py\n```python\n{self.lex_str}\n```\n"
-                                                                f" - tokens.py\n```python\n{self.tok_str}\n```\n\n"
-                                                                f"This is the content of the test suite:\n"
-                                                                f" - tests.py\n```python\n{tests_str}```\n")
-        data = json.loads(res.text)
+        return (execution_prompt(execution) + self._project_files("These are the project file contents:\n") + "\n"
+                                   f"This is the content of the test suite:\n"
+                                   f" - tests.py\n```python\n{tests_str}```\n")
+
+    @staticmethod
+    def _parse_analysis(res: str) -> EvalResponse:
+        data = json.loads(res)
         LOGGER.info("Received response to test suite analyse request!")
         LOGGER.debug("Analyse Score: " + str(data["score"]))
         LOGGER.debug("Analyse Feedback: " + data["feedback"])
 
         return data
 
+    def analyse_testsuite(self, execution: ExecutionResult, tests_str: str | None = None):
+        LOGGER.info("Sending test suite analyse request...")
+        res = self.send_message(self._analyse_message(execution, tests_str))
+        return self._parse_analysis(res)
 
-def execute_testsuite():
+    async def analyse_testsuite_async(self, execution: ExecutionResult, tests_str: str | None = None):
+        LOGGER.info("Sending test suite analyse request...")
+        res = await self.send_message_async(self._analyse_message(execution, tests_str))
+        return self._parse_analysis(res)
+
+
+def _executed(execution: ExecutionResult, run_dir: str) -> ExecutionResult:
+    sources = {f"src/{path}": content for path, content in read_project_sources(run_dir).items()}
+    execution.measure_coverage(sources)
+    execution.measure_tokens(sources.get(TOKEN_MODULE))
+    LOGGER.info(f"Execution of the generated test suite done! {execution.summary()}")
+    LOGGER.info(f"Coverage of src/: {execution.coverage.summary()}")
+    if execution.tokens is not None:
+        LOGGER.info(f"Lexer tokens: {execution.tokens.summary()}")
+    for branch in execution.coverage.missing_branches():
+        LOGGER.debug(f"Uncovered branch {branch}")
+    for test in execution.problems():
+        LOGGER.debug(f"{test.test} {test.outcome}:\n{test.traceback}")
+    if execution.error:
+        LOGGER.debug(f"Test suite error:\n{execution.error}")
+
+    return execution
+
+
+def execute_testsuite(cwd: str = PROJECT_DIR, executor: Executor | None = None, tests_str: str | None = None,
+                      mutation: MutationTester | None = None) -> ExecutionResult:
+    # every execution runs in its own sandbox, the tests.py of the project is run if no suite is given
     LOGGER.info("Starting execution of the generated test suite...")
-    execution = subprocess.run(["python", "-m", "unittest"], capture_output=True, text=True, cwd="./project/")
-    LOGGER.info("Execution of the generated test suite done!")
-    LOGGER.debug("Test suite stdout:\n" + execution.stdout)
-    LOGGER.debug("Test suite stderr:\n" + execution.stderr)
+    with Sandbox(cwd, tests_str) as run_dir:
+        execution = _executed((executor or SubprocessExecutor()).run(run_dir), run_dir)
+        if mutation:
+            execution.mutation = mutation.run(run_dir, execution)
+        return execution
+
+
+async def execute_testsuite_async(cwd: str = PROJECT_DIR, executor: Executor | None = None,
+                                  tests_str: str | None = None,
+                                  mutation: MutationTester | None = None) -> ExecutionResult:
+    # in a thread as a whole, setting up the sandbox (hashing and copying the project) and measuring the results would
+    # block the event loop and every model request in flight; the thread keeps the project context of the log messages
+    return await asyncio.to_thread(execute_testsuite, cwd, executor, tests_str, mutation)
+
+
+class Pipeline:
+    def __init__(self, gen_chat: TestGenChat, eval_chat: TestEvalChat, candidates: int = CANDIDATES,
+                 selection: str = CANDIDATE_SELECTION, checkpoint: Checkpoint | None = None,
+                 on_evaluation: Callable[[int, TestEvalChat.EvalResponse], None] | None = None,
+                 convergence: ConvergenceDetector | None = None, executor: Executor | None = None,
+                 mutation: MutationTester | None = None, local_decision: bool = LOCAL_DECISION,
+                 predictor: ScorePredictor | None = None):
+        self.gen_chat = gen_chat
+        self.eval_chat = eval_chat
+        self.candidates = candidates
+        self.selection = selection
+        self.checkpoint = checkpoint
+        self.on_evaluation = on_evaluation
+        self.convergence = convergence
+        self.executor = executor
+        self.mutation = mutation
+        self.local_decision = local_decision
+        self.predictor = predictor
+        self._predicted = 0  # iterations in a row scored by the predictor
+        self._scored_by = set()  # "evaluator" and "predictor" if they scored a suite of the current iteration
+        self.state = PipelineState()
+        self._usage_mark = self._usage()
+
+    def _usage(self) -> dict[str, int]:
+        return {key: self.gen_chat.usage[key] + self.eval_chat.usage[key] for key in self.gen_chat.usage}
+
+    def _iteration_usage(self) -> dict[str, int]:
+        usage = self._usage()
+        delta = {key: usage[key] - self._usage_mark[key] for key in usage}
+        self._usage_mark = usage
+
+        LOGGER.info(f"Iteration {self.state.iteration} used {delta['requests']} API calls with "
+                    f"{delta['prompt_tokens']} prompt tokens ({delta['cached_tokens']} from the context cache), "
+                    f"~{delta['saved_tokens']} prompt tokens saved by not resending the project files")
+        return delta
+
+    @property
+    def project_dir(self) -> str:
+        return self.gen_chat.project_dir
+
+    def _save_state(self):
+        if self.checkpoint:
+            self.state.gen_history, self.state.eval_history = self.gen_chat.history, self.eval_chat.history
+            self.state.convergence = self.convergence.to_dict() if self.convergence else None
+            self.checkpoint.save(self.state)
+
+    def _resume(self) -> PipelineState:
+        if not self.checkpoint or not self.checkpoint.exists():
+            LOGGER.warning("No checkpoint to resume from found! Starting a new run.")
+            return PipelineState()
+
+        state = self.checkpoint.load()
+        self.gen_chat.history, self.eval_chat.history = state.gen_history, state.eval_history
+        if state.tests is not None:
+            save_tests(self.project_dir, state.tests)
+        if self.convergence and state.convergence:
+            self.convergence = ConvergenceDetector.from_dict(state.convergence)
+            if self.convergence.switched_at is not None:
+                self.candidates = max(self.candidates, CONVERGENCE_SWITCH_CANDIDATES)
+
+        LOGGER.info(f"Resuming from checkpoint {self.checkpoint.path} (iteration {state.iteration}, "
+                    f"last completed phase: {state.phase})")
+        return state
+
+    def _evaluated(self, stats: TestEvalChat.EvalResponse, estimated: bool):
+        self.state.stats, self.state.estimated, self.state.phase = stats, estimated, EVALUATED
+        if self.on_evaluation:
+            self.on_evaluation(self.state.iteration, stats)
+
+    def _rejected(self, problems: list[str]):
+        # a suite that can not run goes straight back to the generator, it is neither executed nor evaluated
+        LOGGER.info(f"Test suite rejected by the static check before execution ({len(problems)} problems)!")
+        for problem in problems:
+            LOGGER.debug(f"Static check: {problem}")
+        self.state.execution = None
+        self._evaluated({"score": 0, "feedback": check_feedback(problems)}, estimated=True)
+
+    async def _select_best_testsuite(self, feedback: str | None):
+        LOGGER.info(f"Requesting {self.candidates} candidate test suites...")
+        gen_forks = [self.gen_chat.fork(sample) for sample in range(self.candidates)]
+        suites = await asyncio.gather(*(fork.candidate_testsuite_async(feedback) for fork in gen_forks))
+        problems = await asyncio.gather(*(asyncio.to_thread(check_suite, suite, self.project_dir) for suite in suites))
+        runnable = [i for i in range(len(suites)) if not problems[i]]
+        if not runnable:
+            best = min(range(len(suites)), key=lambda i: len(problems[i]))
+            LOGGER.info(f"All {self.candidates} candidate test suites were rejected by the static check!")
+            self.gen_chat.history = gen_forks[best].history
+            self.state.tests = self.gen_chat._save_test_suite(suites[best])
+            self._rejected(problems[best])
+            return
+
+        executions = dict(zip(runnable, await asyncio.gather(*(
+            execute_testsuite_async(self.project_dir, self.executor, suites[i], self.mutation) for i in runnable))))
+
+        stats = None
+        if self.selection == "evaluator":
+            candidate_stats = {i: self._decide_locally(executions[i]) for i in runnable}
+            undecided = [i for i in runnable if candidate_stats[i] is None]
+            eval_forks = {i: self.eval_chat.fork() for i in undecided}
+            candidate_stats.update(zip(undecided, await asyncio.gather(*(
+                eval_forks[i].analyse_testsuite_async(executions[i], suites[i]) for i in undecided))))
+            for i in undecided:
+                self._record_score(executions[i], candidate_stats[i])
+            best = max(runnable, key=lambda i: candidate_stats[i]["score"])
+            if best in eval_forks:
+                self.eval_chat.history = eval_forks[best].history
+            stats = candidate_stats[best]
+        else:
+            best = max(runnable, key=lambda i: executions[i].local_score())
+
+        LOGGER.info(f"Selected candidate {best + 1} of {self.candidates} test suites "
+                    f"({len(suites) - len(runnable)} rejected by the static check)!")
+        self.gen_chat.history = gen_forks[best].history
+        self.state.tests = self.gen_chat._save_test_suite(suites[best])
+        self.state.execution, self.state.phase = executions[best], EXECUTED
+        if stats is not None:
+            self._evaluated(stats, estimated=best not in eval_forks)
+
+    async def _generate(self):
+        feedback = self.state.stats["feedback"] if self.state.stats else None
+        execution = self.state.execution
+        if feedback is not None and execution is not None and execution.tokens is not None:
+            # the token variants no test exercised are known locally, whatever the evaluator noticed
+            untested = token_feedback(execution.tokens)
+            feedback = f"{feedback}\n\n{untested}" if untested else feedback
+        if self.candidates > 1:
+            await self._select_best_testsuite(feedback)
+            return
+
+        if feedback is None:
+            self.state.tests = await self.gen_chat.init_testsuite_async()
+        else:
+            self.state.tests = await self.gen_chat.redo_testsuite_async(feedback)
+        self.state.phase = GENERATED
+        problems = await asyncio.to_thread(check_suite, self.state.tests, self.project_dir)
+        if problems:
+            self._rejected(problems)
+
+    async def _execute(self):
+        self.state.execution = await execute_testsuite_async(self.project_dir, self.executor, self.state.tests,
+                                                             self.mutation)
+        self.state.phase = EXECUTED
+
+    def _decide_locally(self, execution: ExecutionResult) -> TestEvalChat.EvalResponse | None:
+        stats = decide_locally(execution) if self.local_decision else None
+        # the evaluator still scores every few iterations, which keeps the predictor calibrated
+        if stats is None and self.predictor and execution is not None \
+                and self._predicted < PREDICTOR_MAX_CONSECUTIVE:
+            stats = self.predictor.decide(execution)
+            if stats is not None:
+                self._scored_by.add("predictor")
+        return stats
+
+    def _record_score(self, execution: ExecutionResult, stats: TestEvalChat.EvalResponse):
+        self._scored_by.add("evaluator")
+        if self.predictor and execution is not None:
+            self.predictor.record(execution, stats["score"], os.path.basename(os.path.abspath(self.project_dir)))
+
+    async def _evaluate(self):
+        stats = self._decide_locally(self.state.execution)
+        if stats is not None:
+            self._evaluated(stats, estimated=True)
+            return
+        stats = await self.eval_chat.analyse_testsuite_async(self.state.execution, self.state.tests)
+        self._record_score(self.state.execution, stats)
+        self._evaluated(stats, estimated=False)
+
+    def _converged(self, api_calls: int) -> bool:
+        if not self.convergence:
+            return False
+
+        self.convergence.record(self.state.stats["score"], self.state.execution, api_calls, self.state.estimated)
+
+        decision = self.convergence.decide()
+        gain = self.convergence.expected_gain()
+        if decision == Decision.SWITCH and self.candidates < CONVERGENCE_SWITCH_CANDIDATES:
+            LOGGER.info(f"Expected gain of {gain:.2f} points per API call is below {self.convergence.min_gain}! "
+                        f"Switching to {CONVERGENCE_SWITCH_CANDIDATES} candidate test suites per iteration.")
+            self.candidates = CONVERGENCE_SWITCH_CANDIDATES
+        elif decision != Decision.CONTINUE:
+            LOGGER.info(f"Expected gain of {gain:.2f} points per API call is below {self.convergence.min_gain}! "
+                        f"Stopping iteration.")
+            return True
+        return False
+
+    def _next_iteration(self):
+        usage = self._iteration_usage()
+        # predictions in a row count per iteration, however many candidates were scored in it
+        self._predicted = 0 if "evaluator" in self._scored_by else self._predicted + ("predictor" in self._scored_by)
+        self._scored_by.clear()
+        score = self.state.stats["score"]
+        if score > SCORE_THRESHOLD:
+            if self.state.iteration == 0:
+                LOGGER.info("Initial test suite analysed good enough already! No interation started")
+            else:
+                LOGGER.info(f"Test suite score of {score} achieved! Stopping iteration.")
+            self.state.finished = True
+        elif self.state.iteration >= MAX_ITERATIONS:
+            LOGGER.info(f"Test suite score of {score} achieved! Maximum of {MAX_ITERATIONS} iterations reached.")
+            self.state.finished = True
+        elif self._converged(usage["requests"]):
+            self.state.finished = True
+        else:
+            if self.state.iteration > 0:
+                LOGGER.info(f"Test suite score of {score} achieved! Continuing iteration.")
+            self.state.iteration += 1
+            self.state.phase = None
+            LOGGER.info(f"+++ START OF ITERATION: {self.state.iteration} +++")
+
+    async def run(self, resume: bool = False) -> TestEvalChat.EvalResponse:
+        self.state = self._resume() if resume else PipelineState()
+
+        # every completed phase is checkpointed, a resumed run continues with the next one
+        while not self.state.finished:
+            if self.state.phase is None:
+                await self._generate()
+            elif self.state.phase == GENERATED:
+                await self._execute()
+            elif self.state.phase == EXECUTED:
+                await self._evaluate()
+            else:
+                self._next_iteration()
+            self._save_state()
 
-    return "The execution of the test suite yielded the following result:\n```\n" + execution.stdout + execution.stderr + "```\n"
+        return self.state.stats
 
 
+def add_cassette_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", metavar="CASSETTE", help="record every model request/response to the cassette")
+    group.add_argument("--replay", metavar="CASSETTE", help="serve model responses from the cassette (offline)")
+    parser.add_argument("--replay-latency", default=None,
+                        help="replay latency: 'recorded' or a synthetic number of seconds (default: instant)")
+    parser.add_argument("--replay-jitter", type=float, default=0.0, help="random +- seconds added to replay latency")
+    parser.add_argument("--no-rate-limit", action="store_true", help="do not throttle model requests")
 
-if __name__ == "__main__":
-    gen_chat = TestGenChat(os.getenv("GEMINI_API_KEY"), MODEL_NAME)
-    eval_chat = TestEvalChat(os.getenv("GEMINI_API_KEY"), MODEL_NAME)
-
-    gen_chat.init_testsuite()
-    ts_output = execute_testsuite()
-    stats = eval_chat.analyse_testsuite(ts_output)
-
-    if stats["score"] > 90:
-        LOGGER.info("Initial test suite analysed good enough already! No interation started")
-    else:
-        for iteration in range(10):
-            LOGGER.info(f"+++ START OF ITERATION: {iteration + 1} +++")
-            gen_chat.redo_testsuite(stats["feedback"])
-            ts_output = execute_testsuite()
-            stats = eval_chat.analyse_testsuite(ts_output)
-
-            if stats["score"] > 90:
-                LOGGER.info(f"Test suite score of {stats['score']} achieved! Stopping iteration.")
-                break
-            else:
-                LOGGER.info(f"Test suite score of {stats['score']} achieved! Continuing iteration.")
 
-            sleep(5)  # max. 15 requests per min allowed
+def add_context_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--context", choices=["inline", "history", "cache"], default=CONTEXT_MODE,
+                        help="send the project files with every message, once per conversation or via the API "
+                             "context cache")
+
+
+def add_executor_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--executor", choices=EXECUTORS, default=EXECUTOR,
+                        help="run every suite in a new python process (executors.py run as a script), in a warm worker "
+                             "process, in a process forked from a pre-loaded fork server or in parallel shards forked "
+                             "from it")
+    parser.add_argument("--no-test-cache", action="store_true",
+                        help="always run every test, instead of reusing the results of unchanged test methods")
+
+
+def add_limit_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--timeout", type=float, default=EXECUTION_TIMEOUT,
+                        help="wall-clock seconds after which a test suite execution is killed (0 disables)")
+    parser.add_argument("--test-timeout", type=float, default=TEST_TIMEOUT,
+                        help="wall-clock seconds after which a single test is interrupted (0 disables)")
+    parser.add_argument("--cpu-limit", type=int, default=EXECUTION_CPU_SECONDS,
+                        help="CPU seconds of a test suite execution (0 disables)")
+    parser.add_argument("--memory-limit", type=int, default=EXECUTION_MEMORY_BYTES // 1024 ** 2,
+                        help="address space of the test process in MiB (0 disables)")
+
+
+def limits_from_arguments(args: argparse.Namespace) -> ExecutionLimits:
+    return ExecutionLimits(args.timeout or None, args.cpu_limit or None, args.memory_limit * 1024 ** 2 or None,
+                           args.test_timeout or None)
+
+
+def cassette_from_arguments(args: argparse.Namespace) -> Cassette | None:
+    if args.record:
+        return Cassette(args.record, "record")
+    if args.replay:
+        return Cassette(args.replay, "replay", args.replay_latency, args.replay_jitter)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Iteratively generate and evaluate a test suite for project/")
+    parser.add_argument("--candidates", type=int, default=CANDIDATES,
+                        help="number of candidate test suites generated concurrently per iteration")
+    parser.add_argument("--selection", choices=["local", "evaluator"], default=CANDIDATE_SELECTION,
+                        help="pick the best candidate by local execution results or by evaluator score")
+    parser.add_argument("--no-cache", action="store_true", help="always query the API, bypassing the response cache")
+    parser.add_argument("--resume", action="store_true", help="continue the last run from its checkpoint")
+    parser.add_argument("--min-gain", type=float, default=CONVERGENCE_MIN_GAIN,
+                        help="stop once the expected score gain per API call drops below this (0 disables)")
+    add_executor_arguments(parser)
+    parser.add_argument("--no-mutation", action="store_true",
+                        help="do not run the mutants of src/ against every executed test suite")
+    parser.add_argument("--no-local-decision", action="store_true",
+                        help="let the evaluator score every test suite, even if the local results are clear")
+    parser.add_argument("--no-predictor", action="store_true",
+                        help="do not replace confident evaluator scores by the score predicted from local results")
+    add_context_arguments(parser)
+    add_limit_arguments(parser)
+    add_cassette_arguments(parser)
+    args = parser.parse_args()
+
+    cassette = cassette_from_arguments(args)
+    limiter = None if args.no_rate_limit else RateLimiter(RATE_LIMITS)
+    # cache hits would never reach the cassette, so recording and replaying always talk to the (replayed) API
+    cache = None if args.no_cache or cassette else ResponseCache()
+    gen_chat = TestGenChat(os.getenv("GEMINI_API_KEY"), MODEL_NAME, limiter, cache=cache, cassette=cassette,
+                           context_mode=args.context)
+    eval_chat = TestEvalChat(os.getenv("GEMINI_API_KEY"), MODEL_NAME, limiter, cache=cache, cassette=cassette,
+                             context_mode=args.context)
+
+    convergence = ConvergenceDetector(args.min_gain) if args.min_gain > 0 else None
+    executor = create_executor(args.executor, PROJECT_DIR, not args.no_test_cache, limits_from_arguments(args))
+    mutation = MutationTester(PROJECT_DIR, limits=limits_from_arguments(args)) \
+        if MUTATION_TESTING and not args.no_mutation else None
+    pipeline = Pipeline(gen_chat, eval_chat, args.candidates, args.selection, Checkpoint.for_project(PROJECT_DIR),
+                        convergence=convergence, executor=executor, mutation=mutation,
+                        local_decision=LOCAL_DECISION and not args.no_local_decision,
+                        predictor=ScorePredictor() if SCORE_PREDICTOR and not args.no_predictor else None)
+    try:
+        asyncio.run(pipeline.run(args.resume))
+    finally:
+        executor.close()
+        if mutation:
+            mutation.close()
+    if cache:
+        cache.log_stats()
 
     del gen_chat, eval_chat
@@ -0,0 +1,188 @@
+import ast
+import enum
+import functools
+import sys
+from dataclasses import asdict, dataclass, field
+
+from static_check import is_enum
+from utils import parse_source
+
+# line and column edge cases of the lexer input and the tokens emitted for it
+EDGE_CASES = {
+    "empty file": "a file without any line",
+    "blank line": "an empty or whitespace-only line between other lines",
+    "comment": "a line with a # comment",
+    "indentation": "a line starting with spaces",
+    "first column": "a token starting in column 0",
+    "end of line": "a token ending in the last column of its line",
+    "operator at end of line": "an operator as the last character of a line",
+    "first line": "a token in the first line of the file",
+    "last line": "a token in the last line of a file with several lines",
+    "adjacent tokens": "two tokens without whitespace between them",
+    "multi-digit literal": "a literal with more than one digit",
+    "keyword prefix": "an identifier containing a keyword, e.g. `classes`",
+}
+
+
+def _is_compound(value) -> bool:
+    # multi-character operators like == or <=, keywords are alphanumeric
+    return isinstance(value, str) and len(value) > 1 and not value.isalnum()
+
+
+def _token_variant(token) -> str:
+    return f"{type(token).__name__}.{token.name}" if isinstance(token, enum.Enum) else type(token).__name__
+
+
+def _edge_cases(tokens: list, locations: list, lines: list[str]) -> set[str]:
+    cases = set()
+    if not lines:
+        cases.add("empty file")
+    if len(lines) > 1 and any(not line.strip() for line in lines):
+        cases.add("blank line")
+    if any("#" in line for line in lines):
+        cases.add("comment")
+    if any(line.startswith(" ") and line.strip() for line in lines):
+        cases.add("indentation")
+
+    keywords = {token.value for token in tokens if isinstance(token, enum.Enum) and isinstance(token.value, str)
+                and token.value.isalnum()}
+    previous = None
+    for token, location in zip(tokens, locations):
+        row, start, end = (getattr(location, name, None) for name in ("line", "start", "end"))
+        if not all(isinstance(number, int) for number in (row, start, end)):
+            continue
+        line = lines[row] if 0 <= row < len(lines) else ""
+        if start == 0:
+            cases.add("first column")
+        if line and end == len(line.rstrip()) - 1:
+            cases.add("end of line")
+            if type(token).__name__ == "Operator":
+                cases.add("operator at end of line")
+        if row == 0:
+            cases.add("first line")
+        if len(lines) > 1 and row == len(lines) - 1:
+            cases.add("last line")
+        if previous is not None and previous[0] == row and previous[1] + 1 == start:
+            cases.add("adjacent tokens")
+        if isinstance(getattr(token, "value", None), int) and not isinstance(token, enum.Enum) and token.value >= 10:
+            cases.add("multi-digit literal")
+        value = getattr(token, "value", None)
+        if type(token).__name__ == "Identifier" and isinstance(value, str) \
+                and any(keyword in value and keyword != value for keyword in keywords):
+            cases.add("keyword prefix")
+        previous = (row, end)
+    return {f"edge:{case}" for case in cases}
+
+
+class TokenRecorder:
+    # token kinds and edge cases of the input of every lexer of src constructed while a test runs; a lexer is a class
+    # of src with get_tokens() and get_locations(), its tokens are recorded even if its constructor raises
+    def __init__(self):
+        self.variants: set[str] = set()
+        self._patched = []
+
+    @staticmethod
+    def _lexer_classes() -> set[type]:
+        classes = set()
+        for name, module in list(sys.modules.items()):
+            if module is None or not (name == "src" or name.startswith("src.")):
+                continue
+            for value in list(vars(module).values()):
+                if isinstance(value, type) and value.__module__ == name and "__init__" in vars(value) \
+                        and callable(getattr(value, "get_tokens", None)) \
+                        and callable(getattr(value, "get_locations", None)):
+                    classes.add(value)
+        return classes
+
+    def _record(self, lexer):
+        try:
+            tokens, locations = lexer.get_tokens(), lexer.get_locations()
+            lines = lexer.get_lines() if callable(getattr(lexer, "get_lines", None)) else []
+        except Exception:
+            return  # the constructor failed before any token was emitted
+        self.variants.update(_token_variant(token) for token in tokens)
+        self.variants.update(_edge_cases(tokens, locations, lines))
+
+    def start(self):
+        for cls in self._lexer_classes():
+            original = vars(cls)["__init__"]
+
+            @functools.wraps(original)
+            def __init__(lexer, *args, __original=original, **kwargs):
+                try:
+                    __original(lexer, *args, **kwargs)
+                finally:
+                    self._record(lexer)
+
+            cls.__init__ = __init__
+            self._patched.append((cls, original))
+
+    def stop(self):
+        for cls, original in reversed(self._patched):
+            cls.__init__ = original
+        self._patched.clear()
+        return self
+
+
+@dataclass
+class TokenMatrix:
+    # exercised (True) or never exercised (False) variants of every group, enum members by their value
+    groups: dict[str, dict[str, bool]] = field(default_factory=dict)
+
+    def missing(self) -> dict[str, list[str]]:
+        return {group: [variant for variant, exercised in variants.items() if not exercised]
+                for group, variants in self.groups.items() if not all(variants.values())}
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{sum(variants.values())}/{len(variants)} {group}"
+                           for group, variants in self.groups.items())
+        return f"token variants exercised: {counts}"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["groups"])
+
+
+def token_matrix(source: str, exercised: set[str]) -> TokenMatrix | None:
+    # every member of the enums of the tokens module, its other classes (e.g. Identifier, Literal), its compound
+    # operators and the edge cases, against the variants the tests exercised
+    try:
+        tree = parse_source(source)
+    except SyntaxError:
+        return None
+    matrix = TokenMatrix()
+    token_types, compound = {}, {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        if not is_enum(node):
+            token_types[node.name] = node.name in exercised
+            continue
+        members = {}
+        for statement in node.body:
+            if isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant) \
+                    and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                value = statement.value.value
+                members[repr(value)] = f"{node.name}.{statement.targets[0].id}" in exercised
+                if _is_compound(value):
+                    compound[repr(value)] = members[repr(value)]
+        matrix.groups[node.name] = members
+    if token_types:
+        matrix.groups["token types"] = token_types
+    if compound:
+        matrix.groups["compound operators"] = compound
+    matrix.groups["edge cases"] = {case: f"edge:{case}" in exercised for case in EDGE_CASES}
+    return matrix
+
+
+def token_feedback(matrix: TokenMatrix) -> str | None:
+    # what the generator should add to the suite, found without the evaluator
+    missing = matrix.missing()
+    if not missing:
+        return None
+    lines = [f"- {group}: " + ", ".join(f"{variant} ({EDGE_CASES[variant]})" if group == "edge cases" else variant
+                                        for variant in variants) for group, variants in missing.items()]
+    return "No test makes the lexer emit or handle the following token variants yet:\n" + "\n".join(lines)
@@ -0,0 +1,139 @@
+import os
+import sys
+from collections import defaultdict
+
+# line number of the arcs into and out of a function
+EXIT = 0
+
+
+class CoverageTracer:
+    # lines and arcs (pairs of consecutive lines of a frame) executed in the python files below the given directories,
+    # recorded with sys.monitoring where available (python 3.12+) and sys.settrace otherwise
+    def __init__(self, directories: list[str]):
+        self.prefixes = tuple(os.path.abspath(directory) + os.sep for directory in directories)
+        self.lines: dict[str, set[int]] = defaultdict(set)
+        self.arcs: dict[str, set[tuple[int, int]]] = defaultdict(set)
+        self._traced: dict[str, bool] = {}
+        self._last: dict = {}  # last line of every running frame (settrace)
+        # last lines of the running activations of every code object, innermost last (sys.monitoring)
+        self._stacks: dict = defaultdict(list)
+        self._previous = None
+        self._monitored = set()
+        self._monitoring = False
+
+    def _is_traced(self, filename: str) -> bool:
+        if filename not in self._traced:
+            self._traced[filename] = os.path.abspath(filename).startswith(self.prefixes)
+        return self._traced[filename]
+
+    def _line(self, key, filename: str, line: int):
+        self.lines[filename].add(line)
+        last = self._last.get(key)
+        if last is not None:
+            self.arcs[filename].add((last, line))
+        self._last[key] = line
+
+    def _exit(self, key, filename: str):
+        last = self._last.pop(key, None)
+        if last is not None:
+            self.arcs[filename].add((last, EXIT))
+
+    # sys.settrace
+
+    def _trace_call(self, frame, event, arg):
+        return self._trace_local if self._is_traced(frame.f_code.co_filename) else None
+
+    def _trace_local(self, frame, event, arg):
+        if event == "line":
+            self._line(frame, frame.f_code.co_filename, frame.f_lineno)
+        elif event == "return":
+            self._exit(frame, frame.f_code.co_filename)
+        elif event == "exception":
+            self._last[frame] = None  # where an exception is raised or passes through is not a branch taken
+        return self._trace_local
+
+    # sys.monitoring
+
+    def _on_start(self, code, offset):
+        if not self._is_traced(code.co_filename):
+            return sys.monitoring.DISABLE
+        if code not in self._monitored:
+            events = sys.monitoring.events
+            sys.monitoring.set_local_events(sys.monitoring.COVERAGE_ID, code,
+                                            events.LINE | events.PY_RETURN | events.PY_YIELD | events.PY_RESUME)
+            self._monitored.add(code)
+        self._stacks[code].append(None)
+
+    def _on_resume(self, code, offset):
+        self._stacks[code].append(None)  # a resumed generator starts over, as with settrace
+
+    def _on_line(self, code, line):
+        stack = self._stacks[code]
+        self.lines[code.co_filename].add(line)
+        if stack and stack[-1] is not None:
+            self.arcs[code.co_filename].add((stack[-1], line))
+        if stack:
+            stack[-1] = line
+        else:
+            stack.append(line)
+
+    def _on_return(self, code, offset, value):
+        # returns and yields
+        stack = self._stacks[code]
+        last = stack.pop() if stack else None
+        if last is not None:
+            self.arcs[code.co_filename].add((last, EXIT))
+
+    def _on_raise(self, code, offset, exception):
+        if code in self._monitored and self._stacks[code]:
+            self._stacks[code][-1] = None
+
+    def _on_unwind(self, code, offset, exception):
+        # left by an exception, no arc
+        if code in self._monitored and self._stacks[code]:
+            self._stacks[code].pop()
+
+    def _start_monitoring(self) -> bool:
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is None:
+            return False
+        try:
+            monitoring.use_tool_id(monitoring.COVERAGE_ID, "testsuitegen")
+        except ValueError:
+            return False  # e.g. coverage.py is measuring this process
+        events = monitoring.events
+        for event, callback in ((events.PY_START, self._on_start), (events.PY_RESUME, self._on_resume),
+                                (events.LINE, self._on_line), (events.PY_RETURN, self._on_return),
+                                (events.PY_YIELD, self._on_return), (events.RAISE, self._on_raise),
+                                (events.PY_UNWIND, self._on_unwind)):
+            monitoring.register_callback(monitoring.COVERAGE_ID, event, callback)
+        monitoring.restart_events()
+        # RAISE and PY_UNWIND can not be enabled per code object
+        monitoring.set_events(monitoring.COVERAGE_ID, events.PY_START | events.RAISE | events.PY_UNWIND)
+        return True
+
+    def _stop_monitoring(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(monitoring.COVERAGE_ID, 0)
+        for code in self._monitored:
+            monitoring.set_local_events(monitoring.COVERAGE_ID, code, 0)
+        events = monitoring.events
+        for event in (events.PY_START, events.PY_RESUME, events.LINE, events.PY_RETURN, events.PY_YIELD, events.RAISE,
+                      events.PY_UNWIND):
+            monitoring.register_callback(monitoring.COVERAGE_ID, event, None)
+        monitoring.free_tool_id(monitoring.COVERAGE_ID)
+
+    def start(self):
+        self._monitoring = self._start_monitoring()
+        if not self._monitoring:
+            self._previous = sys.gettrace()
+            sys.settrace(self._trace_call)
+
+    def stop(self):
+        if self._monitoring:
+            self._stop_monitoring()
+        else:
+            sys.settrace(self._previous)
+        self._last.clear()
+        self._stacks.clear()
+        return self
@@ -1,6 +1,57 @@
+import ast
+import hashlib
+import os
+import threading
+
+# ast.parse is not thread-safe before python 3.12, concurrent calls fail with "AST constructor recursion depth mismatch"
+_PARSE_LOCK = threading.Lock()
+
+
 def clean_python_response(content: str) -> str:
     if content.startswith("```python\n") and content.endswith("```"):
         content = content.replace("```python\n", "", 1)
         content = content.replace("```", "", 1)
 
     return content
+
+
+def parse_source(source: str) -> ast.Module:
+    with _PARSE_LOCK:
+        return ast.parse(source)
+
+
+def read_project_sources(project_dir: str) -> dict[str, str]:
+    # non-empty python files below <project_dir>/src, keyed by their path relative to src/
+    src_dir = os.path.join(project_dir, "src")
+    sources = {}
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for file in sorted(files):
+            if not file.endswith(".py"):
+                continue
+            path = os.path.join(root, file)
+            with open(path, "r") as f:
+                content = f.read()
+            if content.strip():
+                sources[os.path.relpath(path, src_dir).replace(os.sep, "/")] = content
+
+    return sources
+
+
+def project_key(project_dir: str) -> str:
+    # names the state files of a project, e.g. project-3f2a9c01d4e7; projects of a batch may share their basename
+    path = os.path.abspath(project_dir)
+    return f"{os.path.basename(path)}-{hashlib.sha256(path.encode()).hexdigest()[:12]}"
+
+
+def sources_hash(project_dir: str) -> str:
+    sources = read_project_sources(project_dir)
+    return hashlib.sha256("\0".join(f"{name}\0{content}" for name, content in sources.items()).encode()).hexdigest()
+
+
+def save_tests(project_dir: str, tests: str):
+    # replaced atomically, readers of the project never see a partially written suite
+    path = os.path.join(project_dir, "tests.py")
+    with open(f"{path}.tmp", "w") as tests_file:
+        tests_file.write(tests)
+    os.replace(f"{path}.tmp", path)